@@ -0,0 +1,77 @@
+import itertools
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+
+# Number of entries of an array read at a time when processing it in blocks
+_BLOCK_ENTRIES = 2**22
+
+_CHUNK_TYPES = (np.ndarray, list, pd.Series, pd.Index, pd.Categorical,
+                pd.api.extensions.ExtensionArray)
+
+_EMPTY = object()
+
+
+def peek_chunks(values) -> tuple:
+    '''
+    Tells whether values is an iterator of chunks of observations (arrays,
+    lists or pandas objects), as opposed to an in-memory sequence or an
+    iterator of single observations. The first item of an iterator is read
+    ahead to tell, so values must be used as returned afterwards.
+
+    Returns:
+        tuple [whether values is an iterator of chunks, values]
+    '''
+    if not isinstance(values, Iterator):
+        return False, values
+    first = next(values, _EMPTY)
+    if first is _EMPTY:
+        return False, values
+    return isinstance(first, _CHUNK_TYPES), itertools.chain([first], values)
+
+
+def peek_all_chunks(**arrays) -> tuple:
+    '''
+    Applies :func:`peek_chunks` to each of the named arrays given (None for
+    absent ones), which must either all be iterators of chunks or none.
+
+    Returns:
+        tuple [whether the arrays are iterators of chunks, tuple of arrays]
+    '''
+    chunked = {}
+    for name, values in arrays.items():
+        if values is not None:
+            chunked[name], arrays[name] = peek_chunks(values)
+    if len(set(chunked.values())) > 1:
+        raise ValueError(f"{', '.join(chunked)} must be chunked the same way: "
+                         'either all iterators of chunks or all arrays')
+    return any(chunked.values()), tuple(arrays.values())
+
+
+def iter_chunks(*arrays):
+    '''
+    Yields tuples of aligned chunks of the given arrays, where absent
+    arrays (None) give None chunks. Iterators of chunks are zipped
+    together, while arrays (such as an ``np.memmap``) are read in
+    consecutive blocks of rows of about ``_BLOCK_ENTRIES`` entries.
+    '''
+    if any(isinstance(array, Iterator) for array in arrays):
+        yield from zip(*(itertools.repeat(None) if array is None else array
+                         for array in arrays))
+        return
+
+    first = next(array for array in arrays if array is not None)
+    for rows in row_blocks(first):
+        yield tuple(None if array is None else array[rows] for array in arrays)
+
+
+def row_blocks(array) -> list:
+    '''
+    Returns the slices of consecutive blocks of rows of an array (along
+    its first axis), of about ``_BLOCK_ENTRIES`` entries each.
+    '''
+    shape = getattr(array, 'shape', (len(array),))
+    length = shape[0]
+    step = max(_BLOCK_ENTRIES // max(int(np.prod(shape[1:])), 1), 1)
+    return [slice(start, start + step) for start in range(0, length, step)] or [slice(0, 0)]
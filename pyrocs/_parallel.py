@@ -0,0 +1,113 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import NamedTuple
+
+import numpy as np
+
+
+def parallel_map(func, tasks, n_jobs: int = None, executor=None):
+    '''
+    Applies ``func`` to every tuple of arguments in ``tasks`` and yields the
+    results in order.
+
+    Runs serially unless ``n_jobs`` or ``executor`` is given. With ``n_jobs``
+    alone the tasks run on a thread pool of that size (-1 uses all cores);
+    otherwise they are submitted to ``executor``, which may be any
+    ``concurrent.futures`` executor (e.g. a process pool), and the arrays
+    of :func:`shared_arrays` in the arguments are attached in the worker
+    running each task. At most
+    ``2 * n_jobs`` tasks are in flight at a time, so results do not pile up
+    when they are consumed slower than they are produced.
+    '''
+    if n_jobs is None and executor is None:
+        for args in tasks:
+            yield func(*args)
+        return
+
+    if n_jobs is None or n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    if executor is None:
+        with ThreadPoolExecutor(n_jobs) as pool:
+            yield from parallel_map(func, tasks, n_jobs, pool)
+        return
+
+    pending = deque()
+    for args in tasks:
+        pending.append(executor.submit(_run_attached, func, args))
+        if len(pending) > 2 * n_jobs:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class _SharedArray(NamedTuple):
+    '''
+    Handle to an array in shared memory, sent to workers in its place.
+    '''
+    name: str
+    shape: tuple
+    dtype: np.dtype
+
+
+@contextmanager
+def shared_arrays(arrays: tuple, executor=None):
+    '''
+    Makes arrays available to the tasks of :func:`parallel_map` without
+    sending a copy of them along with every task.
+
+    For a ``ProcessPoolExecutor`` the arrays are copied once into shared
+    memory, which is released on exit, and handles to them are yielded to
+    be passed in the task arguments (possibly nested in tuples). Otherwise
+    the arrays themselves are yielded, as threads share them anyway.
+    '''
+    if not isinstance(executor, ProcessPoolExecutor):
+        yield arrays
+        return
+
+    blocks = []
+    try:
+        handles = []
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            handles.append(_SharedArray(block.name, array.shape, array.dtype))
+        yield tuple(handles)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def _run_attached(func, args: tuple):
+    '''
+    Calls ``func`` on arguments where the handles of :func:`shared_arrays`
+    are replaced by the arrays they refer to, which func must not return.
+    '''
+    blocks = []
+
+    def attach(arg):
+        if isinstance(arg, _SharedArray):
+            blocks.append(SharedMemory(arg.name))
+            return np.ndarray(arg.shape, arg.dtype, buffer=blocks[-1].buf)
+        if type(arg) is tuple:
+            return tuple(attach(item) for item in arg)
+        return arg
+
+    try:
+        args = attach(args)
+        return func(*args)
+    finally:
+        del args
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                # Still referenced by the traceback of an exception raised
+                # by func, in which case it is closed once that is freed
+                pass
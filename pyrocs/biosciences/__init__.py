@@ -1,3 +1,4 @@
-from .functional_redundancy import functional_redundancy
-from .hill_diversity import hill_diversity, hill_shannon, hill_simpson
-from .affinity import affinity
\ No newline at end of file
+from .functional_redundancy import functional_redundancy, trait_dissimilarity
+from .hill_diversity import hill_diversity, hill_shannon, hill_simpson, hill_diversity_profile
+from .affinity import affinity, affinity_blocks, affinity_top_k, AffinityAccumulator
+from .hill_rarefaction import hill_bootstrap, hill_rarefaction
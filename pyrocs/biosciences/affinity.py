@@ -1,77 +1,409 @@
-
-from itertools import repeat
 import numpy as np
 from pandas import DataFrame
+from scipy import sparse
+
+from pyrocs._chunks import row_blocks
+from pyrocs._parallel import parallel_map, shared_arrays
+
+
+def _to_bool_array(values: np.ndarray, to_bool=bool) -> np.ndarray:
+    '''
+    Converts an array of values into a boolean presence/absence array.
+    Numeric input converted with ``bool`` is handled natively by NumPy;
+    any other combination falls back to applying ``to_bool`` element-wise.
+    '''
+    values = np.asarray(values)
+    if to_bool is bool and values.dtype.kind in 'biufc':
+        return values != 0
+    return np.vectorize(to_bool, otypes=[bool])(values)
+
+
+def _to_bool_matrix(rows, to_bool=bool):
+    '''
+    Converts a dense or ``scipy.sparse`` matrix into a boolean matrix.
+    Sparse input stays sparse (in CSC format, for cheap column slicing),
+    which requires ``to_bool`` to map zero to False.
+    '''
+    if not sparse.issparse(rows):
+        return _to_bool_array(rows, to_bool)
+
+    rows = sparse.csc_matrix(rows, copy=True)
+    if to_bool(rows.dtype.type(0)):
+        raise ValueError('to_bool must map zero to False for sparse data')
+    rows.data = _to_bool_array(rows.data, to_bool)
+    rows.eliminate_zeros()
+    return rows
+
+
+def _prepare(data, weights=None, to_bool=bool):
+    '''
+    Converts the inputs of the affinity functions into a boolean matrix
+    and an array of site weights.
+    '''
+    # Deal with both DataFrames and NumPy Arrays
+    if isinstance(data, DataFrame):
+        rows = data.to_numpy()
+    else:
+        rows = data
 
-def affinity(data: np.ndarray, weights=None, to_bool=bool) -> float:
+    B = _to_bool_matrix(rows, to_bool)
+
+    # Without weights, give all sites a weight of 1
+    if weights is None:
+        weights = np.ones(B.shape[0])
+    else:
+        weights = np.asarray(weights, dtype=float)
+
+    return B, weights
+
+
+# Number of columns per block when computing blocks in parallel
+_PARALLEL_BLOCK_SIZE = 256
+
+
+def _column_blocks(num_cols: int, block_size: int = None):
+    '''
+    Splits the columns into consecutive ranges of at most ``block_size``.
+    '''
+    if block_size is None:
+        block_size = max(num_cols, 1)
+    if block_size < 1:
+        raise ValueError('block_size must be a positive integer')
+    for start in range(0, num_cols, block_size):
+        yield np.arange(start, min(start + block_size, num_cols))
+
+
+def _pairwise_counts(B: np.ndarray, weights: np.ndarray, rows=None, cols=None):
+    '''
+    Computes the cells of the weighted 2x2 contingency table for every pair
+    of columns of a boolean matrix.
+
+    The joint presences are the weighted matrix product :math:`B^T W B`; the
+    remaining cells follow from the weighted column totals. When the weights
+    are not integral, the counts of sites with a nonzero weight are used to
+    keep cells without any weight at exactly zero despite floating point
+    cancellation. ``rows`` and ``cols``
+    optionally restrict the result to a block of column pairs.
+
+    Returns:
+        tuple(array) [both, i_without_j, j_without_i, neither]
+    '''
+    if rows is None:
+        rows = slice(None)
+    if cols is None:
+        cols = slice(None)
+
+    # Only the blocks of columns are cast to float, not the whole matrix
+    B_i, B_j = B[:, rows].astype(float), B[:, cols].astype(float)
+    present = _weighted_totals(B, weights)
+    total = weights.sum()
+
+    if sparse.issparse(B):
+        both = (B_i.T @ B_j.multiply(weights[:, None])).toarray()
+    else:
+        both = (B_i.T * weights) @ B_j
+    present_i = present[rows][:, None]
+    present_j = present[cols][None, :]
+    i_without_j = present_i - both
+    j_without_i = present_j - both
+    neither = total - (present_i + present_j) + both
+    cells = [both, i_without_j, j_without_i, neither]
+
+    if not np.array_equal(weights, np.round(weights)):
+        nonzero = (weights != 0).astype(float)
+        for cell, count in zip(cells, _pairwise_counts(B, nonzero, rows, cols)):
+            cell[count == 0] = 0
+
+    return tuple(cells)
+
+
+def _weighted_totals(B, weights: np.ndarray) -> np.ndarray:
+    '''
+    Computes the weighted column totals :math:`B^T w` of a boolean matrix,
+    casting a dense matrix to float one block of rows at a time.
+    '''
+    if sparse.issparse(B):
+        return B.T @ weights
+    present = np.zeros(B.shape[1])
+    for rows in row_blocks(B):
+        present += weights[rows] @ B[rows]
+    return present
+
+
+def _log_odds(both, i_without_j, j_without_i, neither) -> np.ndarray:
+    '''
+    Computes the affinity (log odds ratio) from the cells of the 2x2
+    contingency tables.
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        i_given_j_odds_ratio = both / j_without_i
+        i_given_not_j_odds_ratio = i_without_j / neither
+        return np.log(i_given_j_odds_ratio / i_given_not_j_odds_ratio)
+
+
+def _affinity_from_counts(both, i_without_j, j_without_i, neither,
+                          rows=None, cols=None) -> np.ndarray:
+    '''
+    Transforms pairwise contingency counts into (a block of) the affinity
+    matrix.
+
+    The counts cover the columns indexed by ``rows`` against the columns
+    indexed by ``cols`` (all columns by default). Every pair is evaluated
+    with the lower column index in the ``i`` role so that the result is
+    exactly symmetric.
+    '''
+    rows = np.arange(both.shape[0]) if rows is None else np.asarray(rows)
+    cols = np.arange(both.shape[1]) if cols is None else np.asarray(cols)
+
+    upper = _log_odds(both, i_without_j, j_without_i, neither)
+    lower = _log_odds(both, j_without_i, i_without_j, neither)
+    return np.where(rows[:, None] <= cols[None, :], upper, lower)
+
+
+def affinity(data: np.ndarray, weights=None, to_bool=bool,
+             block_size: int = None, out: np.ndarray = None,
+             n_jobs: int = None, executor=None) -> float:
     """
     Returns the affinity between all pairs of columns in binary data.
 
-    This metric evaluates the likelihood of two species to co-occur, 
-    by evaluating the log odds ratio. Unlike other co-occurrence formulations, 
-    the affinity model is insensitive to the relative prevalence of the two species. 
+    This metric evaluates the likelihood of two species to co-occur,
+    by evaluating the log odds ratio. Unlike other co-occurrence formulations,
+    the affinity model is insensitive to the relative prevalence of the two species.
     The equation for Affinity is based on the formulation in :cite:p:`mainali_better_2022`.
-    
+
     .. math::
-    
+
         \\alpha = \\log((p_1/(1-p_1))/ (p_2/(1-p_2)))
-    
-    where :math:`\\alpha` is the affinity, :math:`p_1` and :math:`p_2` are the 
+
+    where :math:`\\alpha` is the affinity, :math:`p_1` and :math:`p_2` are the
     probability of species 1 and species 2 respectively
-    
-    The normalization of each species probability by its complement (i.e., :math:`1-p`) 
+
+    The normalization of each species probability by its complement (i.e., :math:`1-p`)
     results in a binary implementation of affinity within this software.
-    
+
+    The pairwise co-occurrence counts are computed for all columns at once
+    from the weighted matrix product :math:`B^T W B` of the boolean data
+    :math:`B` and the diagonal site weights :math:`W`. Sparse data is kept
+    sparse, and for very wide data the result can be computed in blocks
+    of columns and written into a preallocated array such as a
+    ``np.memmap`` (see also :func:`affinity_blocks` and :func:`affinity_top_k`).
+    The blocks can be computed in parallel; the result is identical to the
+    serial computation with the same ``block_size``.
+
     Args:
-        data (array): Matrix of co-occurring variables
+        data (array): Matrix of co-occurring variables (dense, DataFrame or scipy.sparse)
         weights (optional array): weights for each variable
         to_bool: function or type to convert array values to boolean
-        
+        block_size (optional int): number of columns computed at a time
+        out (optional array): array of shape (num_cols, num_cols) the result
+            is written into, in which case it is returned as is
+        n_jobs (optional int): number of threads computing blocks in parallel
+            (-1 uses all cores)
+        executor (optional Executor): ``concurrent.futures`` executor to
+            compute the blocks with instead of a thread pool of ``n_jobs``;
+            a ``ProcessPoolExecutor`` reads the boolean data from shared
+            memory rather than receiving a copy of it with every block
+
     Returns:
         float
     """
-    
+
     num_cols = data.shape[1]
+    B, weights = _prepare(data, weights, to_bool)
 
-    # Deal with both DataFrames and NumPy Arrays
-    if isinstance(data, DataFrame):
-        rows = data.to_numpy()
+    if out is None:
+        result = np.empty((num_cols, num_cols))
+    elif out.shape != (num_cols, num_cols):
+        raise ValueError('out must have shape (num_cols, num_cols)')
     else:
-        rows = data
-        
-    # Without weights, give all sites a weight of 1
-    if weights is None:
-        weights = repeat(1)
-        
-    # Count pairwise coincidences 
-    counter = {}
-    for row, weight in zip(rows, weights):
-        for i in range(num_cols):
-            i_val = to_bool(row[i])
-            for j in range(i, num_cols):
-                j_val = to_bool(row[j])
-                key = (i, j, i_val, j_val)
-                counter[key] = counter.get(key, 0) + weight
-                
-    # Transform counts into affinity matrix
-    result = np.zeros((num_cols, num_cols))
-                
-    with np.errstate(divide='ignore'): # Ignore Divide-By-Zero Warning
-        for i in range(num_cols):
-            for j in range(i, num_cols):
-                neither = np.float64(counter.get((i, j, False, False), 0))
-                both = np.float64(counter.get((i, j, True, True), 0))
-                i_without_j = np.float64(counter.get((i, j, True, False), 0))
-                j_without_i = np.float64(counter.get((i, j, False, True), 0))
-
-                i_given_j_odds_ratio = both / j_without_i
-                i_given_not_j_odds_ratio = i_without_j / neither
-
-                affinity = np.log(i_given_j_odds_ratio / i_given_not_j_odds_ratio)
-                result[i][j] = affinity
-                result[j][i] = affinity
-            
-    if isinstance(data, DataFrame):
+        result = out
+
+    # Count pairwise coincidences and transform them into the affinity matrix
+    for cols, block in _affinity_blocks(B, weights, block_size, n_jobs, executor):
+        result[:, cols] = block
+
+    if out is None and isinstance(data, DataFrame):
         result = DataFrame(result, index = data.columns, columns = data.columns)
-        
+
     return result
+
+
+def _matrix_parts(B) -> tuple:
+    '''
+    Splits a dense or CSC boolean matrix into the arrays it is made of.
+    '''
+    if sparse.issparse(B):
+        return (B.data, B.indices, B.indptr)
+    return (B,)
+
+
+def _affinity_block(parts: tuple, shape: tuple, weights: np.ndarray,
+                    cols: np.ndarray) -> np.ndarray:
+    '''
+    Computes the affinity of all columns with the columns ``cols``, from
+    the arrays of :func:`_matrix_parts`.
+    '''
+    B = sparse.csc_matrix(parts, shape=shape) if len(parts) == 3 else parts[0]
+    counts = _pairwise_counts(B, weights, cols=cols)
+    return _affinity_from_counts(*counts, cols=cols)
+
+
+def _affinity_blocks(B, weights: np.ndarray, block_size: int = None,
+                     n_jobs: int = None, executor=None):
+    '''
+    Yields the column indices and values of consecutive column blocks
+    of the affinity matrix of a boolean matrix, computing the blocks on
+    ``executor`` (or a thread pool of ``n_jobs``) when given. The matrix
+    is shared with the workers of a process pool once, in shared memory.
+    '''
+    if block_size is None and (n_jobs is not None or executor is not None):
+        block_size = _PARALLEL_BLOCK_SIZE
+
+    blocks = list(_column_blocks(B.shape[1], block_size))
+    with shared_arrays(_matrix_parts(B), executor) as parts:
+        tasks = ((parts, B.shape, weights, cols) for cols in blocks)
+        yield from zip(blocks, parallel_map(_affinity_block, tasks, n_jobs, executor))
+
+
+def affinity_blocks(data: np.ndarray, block_size: int, weights=None, to_bool=bool,
+                    n_jobs: int = None, executor=None):
+    """
+    Generates the affinity matrix of :func:`affinity` in blocks of columns,
+    so that only a ``num_cols x block_size`` slice of it is held in memory
+    at a time.
+
+    Args:
+        data (array): Matrix of co-occurring variables (dense, DataFrame or scipy.sparse)
+        block_size (int): number of columns in each block
+        weights (optional array): weights for each variable
+        to_bool: function or type to convert array values to boolean
+        n_jobs (optional int): number of threads computing blocks in parallel
+        executor (optional Executor): executor to compute the blocks with
+
+    Returns:
+        generator of tuple(array, array) [column indices, affinity of all
+        columns with those columns]
+    """
+    B, weights = _prepare(data, weights, to_bool)
+    yield from _affinity_blocks(B, weights, block_size, n_jobs, executor)
+
+
+def affinity_top_k(data: np.ndarray, k: int, weights=None, to_bool=bool,
+                   block_size: int = 1024, n_jobs: int = None, executor=None) -> tuple:
+    """
+    Returns, for every column, the ``k`` other columns with the highest
+    affinity (see :func:`affinity`), without materializing the full
+    affinity matrix. Pairs with an undefined (NaN) affinity are ranked last.
+
+    Args:
+        data (array): Matrix of co-occurring variables (dense, DataFrame or scipy.sparse)
+        k (int): number of partners to keep per column
+        weights (optional array): weights for each variable
+        to_bool: function or type to convert array values to boolean
+        block_size (int): number of columns computed at a time
+        n_jobs (optional int): number of threads computing blocks in parallel
+        executor (optional Executor): executor to compute the blocks with
+
+    Returns:
+        tuple(array) [indices, affinities] of shape (num_cols, k), sorted
+        by decreasing affinity
+    """
+    num_cols = data.shape[1]
+    k = min(k, num_cols - 1)
+    B, weights = _prepare(data, weights, to_bool)
+
+    indices = np.empty((num_cols, k), dtype=int)
+    values = np.empty((num_cols, k))
+
+    for cols, block in _affinity_blocks(B, weights, block_size, n_jobs, executor):
+        # The matrix is symmetric, so each column holds that column's partners
+        block = block.T
+        ranked = np.where(np.isnan(block), -np.inf, block)
+        ranked[np.arange(len(cols)), cols] = np.nan
+
+        # NaN sorts last, so this drops each column's pair with itself
+        top = np.argpartition(-ranked, max(k - 1, 0), axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(ranked, top, axis=1), axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+
+        indices[cols] = top
+        values[cols] = np.take_along_axis(block, top, axis=1)
+
+    return indices, values
+
+
+class AffinityAccumulator:
+    """
+    Incrementally accumulates the pairwise contingency counts behind
+    :func:`affinity`, for data that arrives in chunks of rows (sites).
+
+    Only the four ``num_cols x num_cols`` count matrices are kept, so
+    chunks can be discarded once they have been added with :meth:`update`.
+    Accumulators fed with different chunks (e.g. in separate processes)
+    can be combined with :meth:`merge`. The :meth:`result` equals a single
+    :func:`affinity` call over the concatenated chunks.
+
+    Args:
+        to_bool: function or type to convert array values to boolean
+    """
+
+    def __init__(self, to_bool=bool):
+        self.to_bool = to_bool
+        self.counts = None
+        self.columns = None
+
+    def update(self, chunk: np.ndarray, weights=None):
+        """
+        Adds the counts of a chunk of rows.
+
+        Args:
+            chunk (array): Matrix of co-occurring variables (dense, DataFrame or scipy.sparse)
+            weights (optional array): weights for each row of the chunk
+        Returns:
+            AffinityAccumulator
+        """
+        B, weights = _prepare(chunk, weights, self.to_bool)
+        counts = _pairwise_counts(B, weights)
+        if isinstance(chunk, DataFrame) and self.columns is None:
+            self.columns = chunk.columns
+        return self._add(counts)
+
+    def merge(self, other: 'AffinityAccumulator'):
+        """
+        Adds the counts accumulated by another accumulator.
+
+        Args:
+            other (AffinityAccumulator): accumulator over the same columns
+        Returns:
+            AffinityAccumulator
+        """
+        if other.counts is not None:
+            self._add(other.counts)
+        if self.columns is None:
+            self.columns = other.columns
+        return self
+
+    def _add(self, counts):
+        if self.counts is None:
+            self.counts = tuple(np.array(cell) for cell in counts)
+        elif self.counts[0].shape != counts[0].shape:
+            raise ValueError('chunks must have the same number of columns')
+        else:
+            for total, cell in zip(self.counts, counts):
+                total += cell
+        return self
+
+    def result(self):
+        """
+        Returns the affinity between all pairs of columns of the data
+        accumulated so far, as :func:`affinity` would.
+
+        Returns:
+            array
+        """
+        if self.counts is None:
+            raise ValueError('no data has been accumulated')
+        result = _affinity_from_counts(*self.counts)
+        if self.columns is not None:
+            result = DataFrame(result, index = self.columns, columns = self.columns)
+        return result
@@ -1,4 +1,7 @@
 import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator
+from scipy.spatial.distance import cdist
 
 def functional_redundancy(p: np.ndarray, delta: np.ndarray) -> float:
     '''
@@ -17,21 +20,33 @@ def functional_redundancy(p: np.ndarray, delta: np.ndarray) -> float:
         Q &= \\sum_i(p_i*(\\sum_j(p_j*δ_{ij})) \\\\
         D &= \\sum_i(p_i*(1-p_i))
 
+    Many assemblages can be evaluated against the same dissimilarities at
+    once by passing one assemblage per row of ``p``; all values of :math:`Q`
+    are then computed from the single product :math:`P\\delta`. For large
+    species pools, ``delta`` may be sparse or any
+    ``scipy.sparse.linalg.LinearOperator``, such as a low-rank factorization
+    or the blockwise trait distances of :func:`trait_dissimilarity`, so that
+    the dense N x N matrix is never materialized.
+
     Args:
         p (array): Relative abundances p[i] (i = 1, 2,…,N) with 0 < p[i] ≤ 1 
             and where the constraint 0 < p[i]
             means that all calculations involve only those species that 
             are actually present in the assemblage with nonzero abundances.
+            May also be a (dense or sparse) matrix with one assemblage per row.
         delta (array): :math:`δ_{ij}` symmetric array of pairwise functional 
-            dissimilarities between species i and j 
+            dissimilarities between species i and j (dense, sparse or LinearOperator)
 
     Returns:
-        float
+        float, or array with one value per assemblage if p is a matrix
     '''
    
-    dim = len(p)
+    dim = p.shape[-1]
     assert delta.shape == (dim, dim)
 
+    if p.ndim == 2 or sparse.issparse(delta) or isinstance(delta, LinearOperator):
+        return _functional_redundancy_batch(p, delta)
+
     # Compute Rao's Quadratic Diversity Index, which is the mean dissimilarity
     # between two random items. This can be computed as the quadratic form:
     # Q = p * delta * p
@@ -42,3 +57,63 @@ def functional_redundancy(p: np.ndarray, delta: np.ndarray) -> float:
 
     FR = 1 - (Q / D)
     return FR
+
+
+def _functional_redundancy_batch(p, delta) -> np.ndarray:
+    '''
+    Computes the functional redundancy of every row of p. A 1-D p is
+    treated as a single row and gives a float.
+    '''
+    P = p if p.ndim == 2 else p.reshape(1, -1)
+
+    if isinstance(delta, LinearOperator) and sparse.issparse(P):
+        delta_P = delta @ P.T.toarray()
+    else:
+        delta_P = delta @ P.T
+
+    # Row-wise quadratic forms p * delta * p and maximum values p * (1 - p)
+    if sparse.issparse(P):
+        Q = np.asarray(P.multiply(delta_P.T).sum(axis=1)).ravel()
+        D = np.asarray(P.sum(axis=1) - P.multiply(P).sum(axis=1)).ravel()
+    else:
+        Q = np.einsum('ij,ji->i', P, delta_P)
+        D = np.einsum('ij,ij->i', P, 1 - P)
+
+    FR = 1 - (Q / D)
+    return FR if p.ndim == 2 else FR[0]
+
+
+def trait_dissimilarity(traits: np.ndarray, metric: str = 'euclidean',
+                        block_size: int = 1024) -> LinearOperator:
+    '''
+    Represents the pairwise dissimilarities between species traits as a
+    linear operator for :func:`functional_redundancy`, without
+    materializing the N x N dissimilarity matrix. Products with the
+    operator compute the distances for ``block_size`` species at a time.
+
+    Args:
+        traits (array): traits[i] is the trait vector of species i
+        metric (str): distance metric accepted by ``scipy.spatial.distance.cdist``
+        block_size (int): number of species whose distances are held in memory at a time
+
+    Returns:
+        LinearOperator
+    '''
+    traits = np.asarray(traits, dtype=float)
+    if traits.ndim == 1:
+        traits = traits[:, None]
+    dim = traits.shape[0]
+
+    def matmat(X):
+        X = np.asarray(X)
+        result = np.empty((dim, X.shape[1]))
+        for start in range(0, dim, block_size):
+            stop = min(start + block_size, dim)
+            result[start:stop] = cdist(traits[start:stop], traits, metric) @ X
+        return result
+
+    def matvec(x):
+        return matmat(np.reshape(x, (-1, 1))).ravel()
+
+    return LinearOperator((dim, dim), matvec=matvec, rmatvec=matvec,
+                          matmat=matmat, rmatmat=matmat, dtype=float)
@@ -1,5 +1,6 @@
 import math
 import numpy as np
+from scipy import sparse
 
 
 def hill_shannon(p: np.ndarray) -> float:
@@ -24,7 +25,9 @@ def hill_shannon(p: np.ndarray) -> float:
     Returns:
         float
     """
-    entropy = -sum(x * np.log(x) for x in p if x > 0)
+    p = np.asarray(p)
+    p = p[p > 0]
+    entropy = -np.sum(p * np.log(p))
     return math.exp(entropy)
 
 
@@ -103,7 +106,71 @@ def hill_diversity(p: np.ndarray, q: float) -> float:
         return np.count_nonzero(p)
 
     # General case
-    D = sum(x**q for x in p)
+    D = np.sum(np.asarray(p) ** q)
     D = D**(1/(1-q))
 
     return D
+
+
+# Distance from q = 1 within which the Hill-Shannon limit is used
+_Q_ONE_TOL = 1e-8
+
+# Maximum number of (abundance, q) terms evaluated at a time
+_MAX_TERMS = 2 ** 22
+
+
+def hill_diversity_profile(p, q) -> np.ndarray:
+    """
+    Computes the Hill Numbers (see :func:`hill_diversity`) of many
+    communities for many values of :math:`q` at once, i.e. the diversity
+    profiles of all communities.
+
+    All powers of the nonzero proportions are summed per community with
+    a single sparse matrix product per batch of :math:`q` values. Species
+    with zero abundance are ignored, :math:`q=0` gives species richness
+    and values of :math:`q` close to 1 use the Hill-Shannon limit.
+
+    Args:
+        p (array): p[s, i] is the proportion of all individuals of community s
+            that belong to species i (dense or scipy.sparse, communities x species)
+        q (array): The exponents that determine the rarity scale on which the mean is taken
+    Returns:
+        array of shape (communities, len(q))
+    """
+    q = np.atleast_1d(np.asarray(q, dtype=float))
+
+    if sparse.issparse(p):
+        p = sparse.csr_matrix(p)
+        num_samples = p.shape[0]
+        sample = np.repeat(np.arange(num_samples), np.diff(p.indptr))
+        values = p.data.astype(float)
+    else:
+        p = np.atleast_2d(np.asarray(p, dtype=float))
+        num_samples = p.shape[0]
+        sample, species = np.nonzero(p)
+        values = p[sample, species]
+
+    present = values > 0
+    sample, values = sample[present], values[present]
+
+    # Sums each term over the species of its community
+    S = sparse.csr_matrix(
+        (np.ones(len(sample)), (sample, np.arange(len(sample)))),
+        shape=(num_samples, len(sample)))
+
+    result = np.empty((num_samples, len(q)))
+    richness = S @ np.ones(len(sample))
+    shannon = np.exp(-(S @ (values * np.log(values))))
+
+    step = max(1, _MAX_TERMS // max(len(values), 1))
+    with np.errstate(divide='ignore', over='ignore'):
+        for start in range(0, len(q), step):
+            q_batch = q[start:start + step]
+            D = S @ np.power(values[:, None], q_batch[None, :])
+            result[:, start:start + step] = D ** (1 / (1 - q_batch))
+
+    result[:, q == 0] = richness[:, None]
+    result[:, np.abs(q - 1) < _Q_ONE_TOL] = shannon[:, None]
+    result[richness == 0] = 0
+
+    return result
@@ -0,0 +1,148 @@
+import numpy as np
+
+from pyrocs._parallel import parallel_map
+from pyrocs.biosciences.hill_diversity import hill_diversity_profile
+
+
+def _resampled_profiles(counts: np.ndarray, q: np.ndarray, size: int,
+                        replace: bool, seed, num_resamples: int) -> np.ndarray:
+    '''
+    Draws ``num_resamples`` samples of ``size`` individuals from the observed
+    counts, with (multinomial) or without (multivariate hypergeometric)
+    replacement, and returns their Hill numbers for every value of ``q``.
+    '''
+    rng = np.random.default_rng(seed)
+    if replace:
+        samples = rng.multinomial(size, counts / counts.sum(), size=num_resamples)
+    else:
+        samples = rng.multivariate_hypergeometric(counts, size, size=num_resamples)
+    return hill_diversity_profile(samples / size, q)
+
+
+def _resample(counts, q, size, replace, seed, num_resamples, chunk_size, n_jobs, executor):
+    '''
+    Resamples in chunks of at most ``chunk_size`` samples, each drawn from
+    its own child of ``seed``, so that the result does not depend on how
+    the chunks are distributed across workers.
+    '''
+    starts = range(0, num_resamples, chunk_size)
+    seeds = _seed_sequence(seed).spawn(len(starts))
+    tasks = ((counts, q, size, replace, chunk_seed, min(chunk_size, num_resamples - start))
+             for start, chunk_seed in zip(starts, seeds))
+    return np.vstack(list(parallel_map(_resampled_profiles, tasks, n_jobs, executor)))
+
+
+def _seed_sequence(seed) -> np.random.SeedSequence:
+    '''
+    Converts a seed (None, an int or a ``SeedSequence``) into a ``SeedSequence``.
+    '''
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def _as_counts(counts) -> np.ndarray:
+    '''
+    Validates a vector of species counts.
+    '''
+    counts = np.asarray(counts)
+    if counts.ndim != 1 or counts.dtype.kind not in 'biu' or np.any(counts < 0):
+        raise ValueError('counts must be a 1-D array of non-negative integers')
+    if counts.sum() == 0:
+        raise ValueError('counts must contain at least one individual')
+    return counts.astype(np.int64)
+
+
+def hill_bootstrap(counts: np.ndarray, q, num_resamples: int = 1000, ci: float = 0.95,
+                   seed=None, chunk_size: int = 100, n_jobs: int = None,
+                   executor=None) -> tuple:
+    """
+    Estimates bootstrap confidence intervals for the Hill Numbers
+    (see :func:`hill_diversity`) of a community.
+
+    The observed individuals are resampled with replacement, i.e. each
+    bootstrap sample is a multinomial draw of the same size as the
+    observed sample, and the Hill Numbers of all bootstrap samples are
+    computed at once with :func:`hill_diversity_profile`. The confidence
+    interval is given by the percentiles of the bootstrap distribution.
+
+    Resamples are drawn in chunks of ``chunk_size`` to cap memory, each
+    chunk from its own seed derived from ``seed``, so results are
+    reproducible for a given seed whatever the number of workers.
+
+    Args:
+        counts (array[int]): counts[i] is the number of observed individuals of species i
+        q (array): The exponents that determine the rarity scale on which the mean is taken
+        num_resamples (int): number of bootstrap samples
+        ci (float): confidence level of the interval
+        seed (optional int or SeedSequence): seed of the random number generator
+        chunk_size (int): number of bootstrap samples drawn at a time
+        n_jobs (optional int): number of threads evaluating chunks in parallel
+        executor (optional Executor): ``concurrent.futures`` executor to
+            evaluate the chunks with (e.g. a process pool)
+    Returns:
+        tuple(array) [estimates, lower bounds, upper bounds], one value per q
+    """
+    counts = _as_counts(counts)
+    q = np.atleast_1d(np.asarray(q, dtype=float))
+
+    estimate = hill_diversity_profile(counts / counts.sum(), q)[0]
+    profiles = _resample(counts, q, counts.sum(), True, seed, num_resamples,
+                         chunk_size, n_jobs, executor)
+    lower, upper = np.quantile(profiles, [(1 - ci) / 2, (1 + ci) / 2], axis=0)
+
+    return estimate, lower, upper
+
+
+def hill_rarefaction(counts: np.ndarray, q, sizes=None, num_resamples: int = 100,
+                     ci: float = 0.95, seed=None, chunk_size: int = 100,
+                     n_jobs: int = None, executor=None) -> tuple:
+    """
+    Computes rarefaction curves of the Hill Numbers (see :func:`hill_diversity`),
+    i.e. their expected value in smaller samples of the observed community.
+
+    For each sample size, subsamples of the observed individuals are drawn
+    without replacement (multivariate hypergeometric draws) and their Hill
+    Numbers are averaged. Sample sizes larger than the observed one would
+    require estimating unobserved species and are not supported.
+
+    Resampling is chunked, seeded and optionally parallel as in
+    :func:`hill_bootstrap`.
+
+    Args:
+        counts (array[int]): counts[i] is the number of observed individuals of species i
+        q (array): The exponents that determine the rarity scale on which the mean is taken
+        sizes (optional array[int]): sample sizes of the curve, at most the
+            observed number of individuals (default: 20 evenly spaced sizes)
+        num_resamples (int): number of subsamples per sample size
+        ci (float): confidence level of the interval
+        seed (optional int or SeedSequence): seed of the random number generator
+        chunk_size (int): number of subsamples drawn at a time
+        n_jobs (optional int): number of threads evaluating chunks in parallel
+        executor (optional Executor): ``concurrent.futures`` executor to
+            evaluate the chunks with (e.g. a process pool)
+    Returns:
+        tuple(array) [sizes, means, lower bounds, upper bounds], with one
+        row per sample size and one column per q
+    """
+    counts = _as_counts(counts)
+    q = np.atleast_1d(np.asarray(q, dtype=float))
+    total = counts.sum()
+
+    if sizes is None:
+        sizes = np.unique(np.linspace(1, total, 20).astype(int))
+    sizes = np.atleast_1d(np.asarray(sizes, dtype=int))
+    if np.any(sizes < 1) or np.any(sizes > total):
+        raise ValueError('sizes must be between 1 and the number of observed individuals')
+
+    seeds = _seed_sequence(seed).spawn(len(sizes))
+    means = np.empty((len(sizes), len(q)))
+    lower = np.empty((len(sizes), len(q)))
+    upper = np.empty((len(sizes), len(q)))
+    for k, (size, size_seed) in enumerate(zip(sizes, seeds)):
+        profiles = _resample(counts, q, size, False, size_seed, num_resamples,
+                             chunk_size, n_jobs, executor)
+        means[k] = profiles.mean(axis=0)
+        lower[k], upper[k] = np.quantile(profiles, [(1 - ci) / 2, (1 + ci) / 2], axis=0)
+
+    return sizes, means, lower, upper
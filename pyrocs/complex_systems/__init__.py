@@ -1,3 +1,5 @@
-from .fluctuation_complexity import fluctuation_complexity
+from .fluctuation_complexity import fluctuation_complexity, fluctuation_complexity_multiscale, FluctuationComplexityAccumulator
+from .graph_analysis import GraphAnalysis, set_backend, get_backend
 from .causal_complexity import cyclomatic_complexity, feedback_density, causal_complexity
-from .grc import grc
\ No newline at end of file
+from .grc import grc, grc_approximate
+from .batch import grc_batch, causal_complexity_batch
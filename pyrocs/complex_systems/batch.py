@@ -0,0 +1,96 @@
+from functools import partial
+from itertools import islice
+
+from pyrocs._parallel import parallel_map
+from pyrocs.complex_systems.causal_complexity import causal_complexity
+from pyrocs.complex_systems.graph_analysis import GraphAnalysis
+from pyrocs.complex_systems.grc import grc
+
+
+def _evaluate_run(metric, matrices, directed, backend) -> list:
+    '''
+    Evaluates a metric on consecutive graphs, preparing each graph as an
+    update of the previous one so that unchanged decompositions are reused.
+    '''
+    results = []
+    G = None
+    for A in matrices:
+        G = GraphAnalysis(A, directed, backend) if G is None else G.update(A)
+        results.append(metric(G))
+    return results
+
+
+def _runs(matrices, run_length: int):
+    '''
+    Splits an iterable of adjacency matrices (or a 3-D stack) into lists of
+    at most ``run_length`` consecutive matrices, without reading ahead.
+    '''
+    iterator = iter(matrices)
+    while True:
+        run = list(islice(iterator, run_length))
+        if not run:
+            return
+        yield run
+
+
+def _batch(metric, matrices, directed, backend, run_length, n_jobs, executor):
+    tasks = ((metric, run, directed, backend) for run in _runs(matrices, run_length))
+    for results in parallel_map(_evaluate_run, tasks, n_jobs, executor):
+        yield from results
+
+
+def grc_batch(matrices, directed : bool = False, backend : str = None,
+              run_length : int = 16, n_jobs : int = None, executor=None,
+              weighted : bool = False):
+    """
+    Computes the global reaching centrality (see :func:`grc`) of each graph
+    of a collection, such as an ensemble or the snapshots of a network
+    evolving over time, and yields the results in order.
+
+    The graphs are read lazily and processed in runs of ``run_length``
+    consecutive graphs, which can be evaluated in parallel. Within a run,
+    each graph is prepared as an update of the previous one (see
+    :meth:`GraphAnalysis.update`), so decompositions left unchanged by a
+    few edge changes are reused. At most a few runs per worker are held in
+    memory at a time.
+
+    Args:
+        matrices: 3-D array of stacked adjacency matrices, or an iterable of
+            (dense or scipy.sparse) adjacency matrices
+        directed (bool): If true, assume each matrix represents a directed graph (row -> column).
+            If false, assume each matrix represents an undirected graph.
+        backend (optional str): graph backend, 'networkx' or 'scipy' (see :func:`set_backend`)
+        run_length (int): number of consecutive graphs evaluated by one task
+        n_jobs (optional int): number of threads evaluating runs in parallel
+        executor (optional Executor): ``concurrent.futures`` executor to
+            evaluate the runs with (e.g. a process pool)
+        weighted (bool): If true, use the entries of the matrices as (positive) edge weights
+    Returns:
+        generator of float
+    """
+    yield from _batch(partial(grc, weighted=weighted), matrices, directed, backend, run_length, n_jobs, executor)
+
+
+def causal_complexity_batch(matrices, directed : bool = False, backend : str = None,
+                            run_length : int = 16, n_jobs : int = None, executor=None):
+    """
+    Computes the causal complexity (see :func:`causal_complexity`) of each
+    graph of a collection, such as an ensemble or the snapshots of a network
+    evolving over time, and yields the results in order.
+
+    Graphs are processed in runs of consecutive graphs as in :func:`grc_batch`.
+
+    Args:
+        matrices: 3-D array of stacked adjacency matrices, or an iterable of
+            (dense or scipy.sparse) adjacency matrices
+        directed (bool): If true, assume each matrix represents a directed graph (row -> column).
+            If false, assume each matrix represents an undirected graph.
+        backend (optional str): graph backend, 'networkx' or 'scipy' (see :func:`set_backend`)
+        run_length (int): number of consecutive graphs evaluated by one task
+        n_jobs (optional int): number of threads evaluating runs in parallel
+        executor (optional Executor): ``concurrent.futures`` executor to
+            evaluate the runs with (e.g. a process pool)
+    Returns:
+        generator of float
+    """
+    yield from _batch(causal_complexity, matrices, directed, backend, run_length, n_jobs, executor)
@@ -1,8 +1,9 @@
 import numpy as np
-import networkx as nx
 
+from pyrocs.complex_systems.graph_analysis import _as_graph_analysis
 
-def cyclomatic_complexity(A : np.ndarray, directed : bool = False) -> float:
+
+def cyclomatic_complexity(A : np.ndarray, directed : bool = False, backend : str = None) -> float:
     '''
     Cyclomatic complexity reflects the number of linearly 
     independent paths within a system of interest 
@@ -23,27 +24,23 @@ def cyclomatic_complexity(A : np.ndarray, directed : bool = False) -> float:
     higher cyclomatic complexity values).     
     
     Args:
-        A (array): Adjacency matrix of graph structure
+        A (array): Adjacency matrix of graph structure, or a prepared
+            :class:`GraphAnalysis` (in which case ``directed`` is taken from it)
+        directed (bool): If true, assume A represents a directed graph (row -> column).
+            If false, assume A represents an undirected graph.
+        backend (optional str): graph backend, 'networkx' or 'scipy' (see :func:`set_backend`)
     Returns:
         float
     '''
 
-    if directed:
-        G = nx.from_numpy_array(A, parallel_edges=False, create_using=nx.MultiDiGraph)
-        E = nx.number_of_edges(G)
-        N = nx.number_of_nodes(G)
-        G_undirected = G.to_undirected()
-        P = nx.number_connected_components(G_undirected)
-    else:
-        G = nx.from_numpy_array(A, parallel_edges=False)
-        E = nx.number_of_edges(G)
-        N = nx.number_of_nodes(G)
-        P = nx.number_connected_components(G)
-
+    G = _as_graph_analysis(A, directed, backend)
+    E = G.number_of_edges
+    N = G.number_of_nodes
+    P = G.number_of_components
 
     return E - N + 2.0 * P 
 
-def feedback_density(A : np.ndarray, directed : bool = False) -> float:
+def feedback_density(A : np.ndarray, directed : bool = False, backend : str = None) -> float:
     '''
     Feedback density captures the fraction of edges :math:`(E_{loop})` 
     and nodes (:math:`N_{loop}`) that are involved in at least one feedback loop.
@@ -64,38 +61,23 @@ def feedback_density(A : np.ndarray, directed : bool = False) -> float:
     edges are included in one or more feedback loops.
     
     Args:
-        A (array): Adjacency matrix of graph structure
+        A (array): Adjacency matrix of graph structure, or a prepared
+            :class:`GraphAnalysis` (in which case ``directed`` is taken from it)
+        directed (bool): If true, assume A represents a directed graph (row -> column).
+            If false, assume A represents an undirected graph.
+        backend (optional str): graph backend, 'networkx' or 'scipy' (see :func:`set_backend`)
     Returns:
         float
     '''
 
-    if directed: 
-        G = nx.from_numpy_array(A, parallel_edges=False, create_using=nx.MultiDiGraph)
-    else:
-        G = nx.from_numpy_array(A, parallel_edges=False)
-
-    Etot = nx.number_of_edges(G)
-    Ntot = nx.number_of_nodes(G)
-
-    Eloop = 0
-    for edge in G.edges:
-        try:
-            if nx.has_path(G, edge[1], edge[0]):
-                Eloop = Eloop + 1
-        except nx.NetworkXNoPath:
-            pass
-
-    Nloop = 0
-    for node in G.nodes:
-        try:
-            if nx.find_cycle(G, node) != None:
-                Nloop = Nloop + 1
-        except nx.NetworkXNoCycle:
-            pass
+    G = _as_graph_analysis(A, directed, backend)
+    Etot = G.number_of_edges
+    Ntot = G.number_of_nodes
+    Eloop, Nloop = G.loop_counts
 
     return (Eloop + Nloop) / (Etot + Ntot)
 
-def causal_complexity(A: np.ndarray, directed : bool = False) -> float:
+def causal_complexity(A: np.ndarray, directed : bool = False, backend : str = None) -> float:
     '''
     Causal complexity measures the underlying causal structure 
     of a system by considering both the system’s intricacy as
@@ -124,10 +106,15 @@ def causal_complexity(A: np.ndarray, directed : bool = False) -> float:
     of causal complexity than those systems with lower feedback density.
     
     Args:
-        A (array): Adjacency matrix of graph structure
+        A (array): Adjacency matrix of graph structure, or a prepared
+            :class:`GraphAnalysis` (in which case ``directed`` is taken from it)
+        directed (bool): If true, assume A represents a directed graph (row -> column).
+            If false, assume A represents an undirected graph.
+        backend (optional str): graph backend, 'networkx' or 'scipy' (see :func:`set_backend`)
     Returns:
         float
     '''
+    A = _as_graph_analysis(A, directed, backend)
     M = cyclomatic_complexity(A, directed=directed)
     D = feedback_density(A, directed=directed)
 
@@ -1,46 +1,376 @@
 import math
-from collections import Counter
+from collections import Counter, deque
 from functools import lru_cache
 
+import numpy as np
+
+# Number of adjacent pairs whose terms are summed at a time
+_CHUNK_SIZE = 2**20
+
+
 def fluctuation_complexity(A, L : int = 1) -> float:
     '''
-    
-    Fluctuating complexity extends the characterization of discrete entropy 
-    to consider the ordering of states, by measuring the variation of probability 
-    between adjacent events. Specifically, the fluctuating complexity measures 
-    the probability of an event immediately following another event by 
+
+    Fluctuating complexity extends the characterization of discrete entropy
+    to consider the ordering of states, by measuring the variation of probability
+    between adjacent events. Specifically, the fluctuating complexity measures
+    the probability of an event immediately following another event by
     calculating the mean squared difference between the log(probability) of these events.
-        
-    The equation within the package follows the formulation from 
+
+    The equation within the package follows the formulation from
     :cite:p:`parrott_measuring_2010` as follows:
-    
+
     .. math::
         C_F = - \\sum_{i,j=1}^n p_{L,ij} \\left(\\log_2\\frac{p_{L,i}}{p_{L,j}}\\right) ^2
-    
-    where :math:`C_F` is the fluctuating complexity, 
-    :math:`p_{L,ij}` refers to the probability of observing event j 
-    immediately following the word I in a series of 
-    length L, and :math:`p_{L,i}` and :math:`p_{L,j}` correspond to the 
-    respective frequencies of event :math:`i` and :math:`j` within the series. 
-    
+
+    where :math:`C_F` is the fluctuating complexity,
+    :math:`p_{L,ij}` refers to the probability of observing event j
+    immediately following the word I in a series of
+    length L, and :math:`p_{L,i}` and :math:`p_{L,j}` correspond to the
+    respective frequencies of event :math:`i` and :math:`j` within the series.
+
+    Sequences of numbers (or numpy arrays of strings) are processed as
+    arrays: symbols and words of L symbols are encoded as integer codes,
+    so long sequences never materialize one Python object per word. Other
+    sequences of hashable symbols are processed element by element.
+
     Args:
         A (array): Sequence of symbols
         L (int): If > 1, groups symbols into short subsequences of length L.
     Returns:
         float
     '''
+    codes = _word_codes(A, L)
+    if codes is None:
+        return _fluctuation_complexity_hashable(A, L)
+    return _fluctuation_complexity_codes(codes)
+
+
+def fluctuation_complexity_multiscale(A, Ls) -> np.ndarray:
+    '''
+    Computes the fluctuation complexity (see :func:`fluctuation_complexity`)
+    of a sequence for several word lengths L at once, e.g. to find a
+    characteristic scale.
+
+    The positions of the sequence are sorted once by the words of maximum
+    length starting there, with ranks built by prefix doubling as for a
+    suffix array. Words of any shorter length L starting at consecutive
+    positions of that order share a prefix whose length is computed once,
+    so that every L only costs a linear pass instead of a new encoding of
+    the sequence. Results
+    equal separate calls to :func:`fluctuation_complexity`. Lengths
+    leaving fewer than two words give NaN.
+
+    Args:
+        A (array): Sequence of symbols
+        Ls (array[int]): Lengths of the words the symbols are grouped into
+    Returns:
+        array: one complexity per length in Ls
+    '''
+    Ls = [int(L) for L in np.atleast_1d(Ls)]
+    if min(Ls) < 1:
+        raise ValueError('word lengths must be positive')
+
+    codes = _symbol_codes(A)
+    if codes is None:
+        return np.array([fluctuation_complexity(A, L) if len(A) > L else np.nan
+                         for L in Ls])
+
+    n = len(codes)
+    max_L = max(Ls)
+
+    # ranks[k][i] ranks the window of 2**k symbols starting at i, with the
+    # sequence padded by a symbol smaller than all others
+    ranks = [np.concatenate([codes + 1, np.zeros(max_L, dtype=np.int64)])]
+    while 2 ** len(ranks) <= max_L:
+        half = 2 ** (len(ranks) - 1)
+        ranks.append(_pair_ranks(ranks[-1], _shifted(ranks[-1], half)))
+
+    # Sort positions by their longest word, then find how many symbols the
+    # words at consecutive positions share, by binary lifting over the ranks
+    k = max_L.bit_length() - 1
+    order = np.lexsort((ranks[k][max_L - 2 ** k:max_L - 2 ** k + n], ranks[k][:n]))
+    common = np.zeros(max(n - 1, 0), dtype=np.int64)
+    for k in reversed(range(len(ranks))):
+        previous, current = order[:-1] + common, order[1:] + common
+        common += 2 ** k * ((common + 2 ** k <= max_L) & (ranks[k][previous] == ranks[k][current]))
+
+    complexities = np.full(len(Ls), np.nan)
+    word_freqs = np.empty(n, dtype=np.int64)
+    for i, L in enumerate(Ls):
+        num_words = n + 1 - L
+        if num_words < 2:
+            continue
+        # Words of length L are runs of the order, counted over the
+        # positions where a whole word fits
+        words = np.concatenate([[0], np.cumsum(common < L)])
+        freqs = np.bincount(words[order < num_words], minlength=words[-1] + 1)
+        word_freqs[order] = freqs[words]
+        complexities[i] = _fluctuation_complexity_freqs(word_freqs[:num_words])
+    return complexities
+
+
+def _fluctuation_complexity_codes(codes : np.ndarray) -> float:
+    '''
+    Computes the fluctuation complexity of a sequence of words given as
+    non-negative integer codes.
+    '''
+    return _fluctuation_complexity_freqs(np.bincount(codes)[codes])
+
+
+def _fluctuation_complexity_freqs(word_freqs : np.ndarray) -> float:
+    '''
+    Computes the fluctuation complexity of a sequence of words given the
+    frequency of the word at each position.
+    '''
+    N = len(word_freqs)
+
+    # The term of a pair of words only depends on their two frequencies,
+    # so it is evaluated once per pair of distinct frequencies present
+    distinct_freqs = np.flatnonzero(np.bincount(word_freqs)[1:]) + 1
+    F = len(distinct_freqs)
+    freq_ranks = np.zeros(distinct_freqs[-1] + 1 if F else 1, dtype=np.int64)
+    freq_ranks[distinct_freqs] = np.arange(F)
+    ranks = freq_ranks[word_freqs]
+    keys = ranks[:-1] * F + ranks[1:]
+
+    terms = np.zeros(F * F)
+    for key in np.flatnonzero(np.bincount(keys, minlength=F * F)):
+        a, b = divmod(int(key), F)
+        log_freq_ratio = math.log2(int(distinct_freqs[a]) / int(distinct_freqs[b]))
+        terms[key] = log_freq_ratio * log_freq_ratio
+
+    # Sum in sequence order, carrying the running total into each chunk
+    total_sqr_diff = 0.0
+    for start in range(0, len(keys), _CHUNK_SIZE):
+        chunk = terms[keys[start:start + _CHUNK_SIZE]]
+        chunk[0] += total_sqr_diff
+        total_sqr_diff = float(np.cumsum(chunk)[-1])
+    return total_sqr_diff / (N - 1)
+
+
+def _symbol_codes(A) -> np.ndarray:
+    '''
+    Encodes the symbols of A as integer codes from 0, their index in the
+    sorted alphabet. Returns None when A is not a 1-D sequence of numbers
+    (or a numpy array of strings), whose symbols cannot be compared as
+    array elements.
+    '''
+    if isinstance(A, np.ndarray):
+        values = A
+        kinds = 'biufUS'
+    else:
+        try:
+            values = np.asarray(A)
+        except ValueError:
+            return None
+        kinds = 'biuf'
+    if values.dtype.kind not in kinds or values.ndim != 1:
+        return None
+
+    _, codes = np.unique(values, return_inverse=True)
+    return codes.ravel().astype(np.int64)
+
+
+def _word_codes(A, L : int) -> np.ndarray:
+    '''
+    Encodes the symbols of A, or its words of L consecutive symbols, as
+    integer codes from 0, equal exactly when the symbols (words) are equal.
+
+    Words are packed as mixed-radix numbers with one digit per symbol (see
+    :func:`_symbol_codes`). Whenever the packed codes could overflow, they
+    are renumbered from 0. Returns None when the symbols cannot be encoded.
+    '''
+    codes = _symbol_codes(A)
+    if codes is None or L <= 1:
+        return codes
+
+    num_words = max(len(codes) + 1 - L, 0)
+    radix = int(codes.max()) + 1 if len(codes) else 1
+    words = codes[:num_words]
+    bound = radix
+    for k in range(1, L):
+        if bound * radix > np.iinfo(np.int64).max:
+            _, words = np.unique(words, return_inverse=True)
+            bound = len(words) and int(words.max()) + 1
+        words = words * radix + codes[k:k + num_words]
+        bound *= radix
+    _, words = np.unique(words, return_inverse=True)
+    return words.ravel().astype(np.int64)
+
+
+def _pair_ranks(first : np.ndarray, second : np.ndarray) -> np.ndarray:
+    '''
+    Ranks pairs of non-negative integers in lexicographic order, giving
+    equal pairs equal ranks.
+    '''
+    _, ranks = np.unique(first * (int(second.max()) + 1) + second, return_inverse=True)
+    return ranks.ravel().astype(np.int64)
+
+
+def _shifted(values : np.ndarray, shift : int) -> np.ndarray:
+    '''
+    Shifts an array left by ``shift`` positions, filling with zeros.
+    '''
+    return np.concatenate([values[shift:], np.zeros(shift, dtype=values.dtype)])
+
+
+def _fluctuation_complexity_hashable(A, L : int) -> float:
+    '''
+    Computes the fluctuation complexity of a sequence of arbitrary hashable
+    symbols, counting words of L symbols as tuples.
+    '''
     if L > 1:
         A = [tuple(A[i: i + L]) for i in range(len(A) + 1 - L)]
-        
+
     N = len(A)
     freqs = Counter(A)
-    
+
     @lru_cache(maxsize=None)
     def square_log_freq_ratio(pair):
         a, b = pair
         log_freq_ratio = math.log2(freqs[a] / freqs[b])
         return log_freq_ratio * log_freq_ratio
-    
+
     pairs = zip(A[:-1], A[1:])
     total_sqr_diff = sum(square_log_freq_ratio(p) for p in pairs)
-    return total_sqr_diff / (N - 1)
\ No newline at end of file
+    return total_sqr_diff / (N - 1)
+
+
+class FluctuationComplexityAccumulator:
+    '''
+    Online estimator of :func:`fluctuation_complexity` for unbounded
+    streams of symbols.
+
+    Only the counts of words and of pairs of adjacent words, the sufficient
+    statistics of the complexity, are kept, so symbols can be discarded
+    once they have been added with :meth:`update`. :meth:`value` recomputes
+    the complexity from them in time proportional to the number of
+    distinct pairs, and equals :func:`fluctuation_complexity` of all the
+    symbols seen so far, up to rounding.
+
+    For drift monitoring, the statistics can cover only the last ``window``
+    words (which are then kept in memory), or be exponentially decayed, in
+    which case every new word multiplies the weight of all previous words
+    and pairs by ``decay``.
+
+    Args:
+        L (int): If > 1, groups symbols into short subsequences of length L.
+        window (optional int): number of most recent words the statistics cover
+        decay (optional float): factor between 0 and 1 applied to the
+            weights of previous words and pairs at each new word
+    '''
+
+    # Decayed weights are rescaled once the weight of new words exceeds
+    # _MAX_SCALE, and weights below _MIN_WEIGHT are then forgotten
+    _MAX_SCALE = 2.0**100
+    _MIN_WEIGHT = 2.0**-400
+
+    def __init__(self, L : int = 1, window : int = None, decay : float = None):
+        if window is not None and decay is not None:
+            raise ValueError('window and decay cannot be combined')
+        if window is not None and window < 2:
+            raise ValueError('window must be at least 2')
+        if decay is not None and not 0 < decay <= 1:
+            raise ValueError('decay must be between 0 and 1')
+
+        self.L = L
+        self.window = window
+        self.decay = decay
+        self.word_counts = Counter()
+        self.pair_counts = Counter()
+        self.num_pairs = 0
+        self._tail = []
+        self._words = deque()
+        self._scale = 1.0
+
+    def update(self, symbols):
+        '''
+        Adds symbols at the end of the stream.
+
+        Args:
+            symbols (array): Sequence of symbols
+        Returns:
+            FluctuationComplexityAccumulator
+        '''
+        symbols = self._tail + list(symbols)
+        if self.L > 1:
+            words = [tuple(symbols[i: i + self.L]) for i in range(len(symbols) + 1 - self.L)]
+            self._tail = symbols[max(len(symbols) + 1 - self.L, 0):]
+        else:
+            words = symbols
+
+        if self.window is not None:
+            self._add_windowed(words)
+        elif self.decay is not None:
+            self._add_decayed(words)
+        else:
+            # The last word of the previous update starts the first pair
+            sequence = list(self._words) + words
+            self.word_counts.update(words)
+            self.pair_counts.update(zip(sequence[:-1], sequence[1:]))
+            self.num_pairs += max(len(sequence) - 1, 0)
+            self._words = deque(sequence[-1:])
+        return self
+
+    def _add_windowed(self, words):
+        for word in words:
+            if self._words:
+                self.pair_counts[self._words[-1], word] += 1
+                self.num_pairs += 1
+            self._words.append(word)
+            self.word_counts[word] += 1
+
+            if len(self._words) > self.window:
+                oldest = self._words.popleft()
+                _decrement(self.word_counts, oldest)
+                _decrement(self.pair_counts, (oldest, self._words[0]))
+                self.num_pairs -= 1
+
+    def _add_decayed(self, words):
+        for word in words:
+            self._scale /= self.decay
+            if self._words:
+                self.pair_counts[self._words[-1], word] += self._scale
+                self.num_pairs += self._scale
+            self._words = deque([word])
+            self.word_counts[word] += self._scale
+
+            if self._scale > self._MAX_SCALE:
+                self._rescale()
+
+    def _rescale(self):
+        '''
+        Divides all decayed weights by the current scale, forgetting the
+        words and pairs whose weight has become negligible.
+        '''
+        self.word_counts = Counter({
+            word: count / self._scale for word, count in self.word_counts.items()
+            if count / self._scale > self._MIN_WEIGHT})
+        self.pair_counts = Counter({
+            (a, b): count / self._scale for (a, b), count in self.pair_counts.items()
+            if count / self._scale > self._MIN_WEIGHT and a in self.word_counts and b in self.word_counts})
+        self.num_pairs /= self._scale
+        self._scale = 1.0
+
+    def value(self) -> float:
+        '''
+        Returns the fluctuation complexity of the symbols accumulated so far
+        (within the window, or with decayed weights).
+
+        Returns:
+            float
+        '''
+        total_sqr_diff = math.fsum(
+            count * math.log2(self.word_counts[a] / self.word_counts[b]) ** 2
+            for (a, b), count in self.pair_counts.items())
+        return total_sqr_diff / self.num_pairs
+
+
+def _decrement(counts : Counter, key):
+    '''
+    Decrements a count, dropping keys whose count reaches zero.
+    '''
+    counts[key] -= 1
+    if counts[key] == 0:
+        del counts[key]
@@ -0,0 +1,349 @@
+from collections import deque
+from functools import cached_property
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+BACKENDS = ('networkx', 'scipy')
+
+_default_backend = 'networkx'
+
+
+def set_backend(backend: str):
+    '''
+    Sets the graph backend used by the metrics of this module when none is
+    given explicitly: ``'networkx'`` (default) builds networkx graphs, while
+    ``'scipy'`` works directly on the sparse adjacency matrix with
+    ``scipy.sparse.csgraph``, avoiding the overhead of networkx objects on
+    large graphs. Both backends return identical results, up to floating
+    point rounding for weighted metrics, including where shortest paths tie.
+
+    Args:
+        backend (str): 'networkx' or 'scipy'
+    '''
+    global _default_backend
+    _default_backend = _check_backend(backend)
+
+
+def get_backend() -> str:
+    '''
+    Returns the graph backend used when none is given explicitly.
+
+    Returns:
+        str
+    '''
+    return _default_backend
+
+
+def _check_backend(backend: str) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f'backend must be one of {BACKENDS}')
+    return backend
+
+
+class GraphAnalysis:
+    '''
+    A graph prepared once for the structural metrics of this module.
+
+    The adjacency matrix is converted to a graph a single time, and the
+    structural decompositions the metrics rely on (connected components,
+    strongly connected components, loop counts, ...) are computed lazily
+    on first use and cached, so that several metrics of the same graph
+    share them. Any function of this module accepting an adjacency matrix
+    also accepts a ``GraphAnalysis``.
+
+    Args:
+        A (array): Adjacency matrix of graph structure (dense or scipy.sparse)
+        directed (bool): If true, assume A represents a directed graph (row -> column).
+            If false, assume A represents an undirected graph.
+        backend (optional str): 'networkx' or 'scipy' (see :func:`set_backend`)
+    '''
+
+    def __init__(self, A, directed: bool = False, backend: str = None):
+        if not sparse.issparse(A) and A.ndim != 2:
+            raise ValueError('A must be a square adjacency matrix')
+        if A.shape[0] != A.shape[1]:
+            raise ValueError('A must be a square adjacency matrix')
+
+        self.adjacency = sparse.csr_matrix(A)
+        self.adjacency.eliminate_zeros()
+        self.adjacency.sort_indices()
+        self.directed = directed
+        self.backend = _check_backend(backend or get_backend())
+
+    @classmethod
+    def from_edge_list(cls, edges, num_nodes: int, directed: bool = False,
+                       backend: str = None):
+        '''
+        Prepares a graph from a list of ``(u, v)`` or ``(u, v, weight)``
+        edges between nodes numbered from 0 to ``num_nodes - 1``.
+
+        Args:
+            edges (list): edges of the graph
+            num_nodes (int): number of nodes of the graph
+            directed (bool): If true, edges are directed from u to v
+            backend (optional str): 'networkx' or 'scipy'
+        Returns:
+            GraphAnalysis
+        '''
+        edges = np.asarray(edges, dtype=float)
+        if edges.size == 0:
+            edges = edges.reshape(0, 2)
+        weights = edges[:, 2] if edges.shape[1] > 2 else np.ones(len(edges))
+        A = sparse.csr_matrix(
+            (weights, (edges[:, 0].astype(int), edges[:, 1].astype(int))),
+            shape=(num_nodes, num_nodes))
+        return cls(A, directed, backend)
+
+    def update(self, A) -> 'GraphAnalysis':
+        '''
+        Prepares a modified version of this graph (e.g. the next snapshot
+        of a graph evolving over time), reusing the cached decompositions
+        that the changes provably leave intact:
+
+        - with the same edges, all structural results are reused;
+        - edges added within a strongly connected component, or removed
+          between two of them, leave the strongly connected components
+          unchanged, and when edges are only added within them, the reach
+          counts are unchanged as well;
+        - edges only added within a connected component leave the
+          connected components unchanged.
+
+        Args:
+            A (array): Adjacency matrix of the modified graph (dense or scipy.sparse)
+        Returns:
+            GraphAnalysis
+        '''
+        new = GraphAnalysis(A, self.directed, self.backend)
+        if new.number_of_nodes != self.number_of_nodes:
+            return new
+
+        cached = self.__dict__
+        added = (new.edges > self.edges).tocoo()
+        removed = (self.edges > new.edges).tocoo()
+
+        if added.nnz == 0 and removed.nnz == 0:
+            for name in ['connected_components', 'strongly_connected_components',
+                         'number_of_components', 'reach_counts', 'loop_counts']:
+                if name in cached:
+                    new.__dict__[name] = cached[name]
+            return new
+
+        if 'connected_components' in cached and removed.nnz == 0:
+            labels = self.connected_components
+            if np.all(labels[added.row] == labels[added.col]):
+                new.__dict__['connected_components'] = labels
+                new.__dict__['number_of_components'] = self.number_of_components
+
+        if self.directed and 'strongly_connected_components' in cached:
+            labels = self.strongly_connected_components
+            if (np.all(labels[added.row] == labels[added.col])
+                    and np.all(labels[removed.row] != labels[removed.col])):
+                new.__dict__['strongly_connected_components'] = labels
+                if 'reach_counts' in cached and removed.nnz == 0:
+                    new.__dict__['reach_counts'] = self.reach_counts
+
+        return new
+
+    @cached_property
+    def graph(self) -> nx.Graph:
+        '''NetworkX graph with one edge per nonzero entry of the adjacency matrix.'''
+        create_using = nx.DiGraph if self.directed else nx.Graph
+        return nx.from_scipy_sparse_array(self.adjacency, create_using=create_using)
+
+    @cached_property
+    def edges(self) -> sparse.csr_matrix:
+        '''
+        Boolean matrix with one entry per edge: the nonzero pattern of the
+        adjacency matrix, restricted to its upper triangle after
+        symmetrization for undirected graphs.
+        '''
+        pattern = self.adjacency.astype(bool)
+        if not self.directed:
+            pattern = sparse.triu(pattern + pattern.T, format='csr')
+        return pattern
+
+    @cached_property
+    def edge_weights(self) -> sparse.csr_matrix:
+        '''
+        Weight of each edge, with the same nonzero pattern as :attr:`edges`.
+        In an undirected graph, an edge given in both directions takes its
+        weight from the lower triangle of the adjacency matrix, as in the
+        networkx graph.
+        '''
+        if self.directed:
+            return self.adjacency
+        upper = sparse.triu(self.adjacency, format='csr')
+        lower = sparse.tril(self.adjacency, -1, format='csr').T.tocsr()
+        weights = upper - upper.multiply(lower.astype(bool)) + lower
+        weights.eliminate_zeros()
+        weights.sort_indices()
+        return weights.tocsr()
+
+    @cached_property
+    def number_of_nodes(self) -> int:
+        return self.adjacency.shape[0]
+
+    @cached_property
+    def number_of_edges(self) -> int:
+        if self.backend == 'networkx':
+            return nx.number_of_edges(self.graph)
+        return self.edges.nnz
+
+    @cached_property
+    def connected_components(self) -> np.ndarray:
+        '''Connected component label of each node, ignoring edge directions.'''
+        if self.backend == 'networkx':
+            if self.directed:
+                return _labels(nx.weakly_connected_components(self.graph), self.number_of_nodes)
+            return _labels(nx.connected_components(self.graph), self.number_of_nodes)
+        return csgraph.connected_components(self.adjacency, self.directed, connection='weak')[1]
+
+    @cached_property
+    def strongly_connected_components(self) -> np.ndarray:
+        '''Strongly connected component label of each node (connected components if undirected).'''
+        if not self.directed:
+            return self.connected_components
+        if self.backend == 'networkx':
+            return _labels(nx.strongly_connected_components(self.graph), self.number_of_nodes)
+        return csgraph.connected_components(self.adjacency, True, connection='strong')[1]
+
+    @cached_property
+    def number_of_components(self) -> int:
+        '''Number of connected components, ignoring edge directions.'''
+        return len(np.unique(self.connected_components))
+
+    @cached_property
+    def reach_counts(self) -> np.ndarray:
+        '''
+        Number of other nodes reachable from each node, propagated through
+        the DAG of strongly connected components (see :func:`_condensation_reach_counts`).
+        '''
+        labels = self.strongly_connected_components
+        if not self.directed:
+            return np.bincount(labels)[labels] - 1
+        edges = self.edges.tocoo()
+        return _condensation_reach_counts(labels, edges.row, edges.col)
+
+    @cached_property
+    def loop_counts(self) -> tuple:
+        '''
+        Numbers of edges and nodes involved in feedback loops.
+
+        In a directed graph, an edge (u, v) lies on a cycle exactly when
+        there is a path back from v to u, i.e. when u and v belong to the
+        same strongly connected component (self-loops included). A node is
+        counted when a cycle can be reached from it, i.e. when its
+        component can reach a component that contains a cycle (more than
+        one node, or a self-loop).
+
+        In an undirected graph, every edge can be traversed back, so all
+        edges are counted. A node is counted when its connected component
+        contains a cycle, i.e. when the component has at least as many
+        edges (self-loops included) as nodes.
+        '''
+        edges = self.edges.tocoo()
+        labels = self.strongly_connected_components
+        sizes = np.bincount(labels)
+
+        if not self.directed:
+            component_edges = np.bincount(labels[edges.row], minlength=len(sizes))
+            Nloop = sizes[component_edges >= sizes].sum()
+            return self.number_of_edges, int(Nloop)
+
+        internal = labels[edges.row] == labels[edges.col]
+        Eloop = int(internal.sum())
+
+        # Nodes on a cycle, then every node that can reach one of them,
+        # found from a virtual node linked to all of them in the reversed graph
+        cyclic = sizes[labels] > 1
+        cyclic[edges.row[edges.row == edges.col]] = True
+        N = self.number_of_nodes
+        reverse = sparse.csr_matrix(
+            (np.ones(len(edges.row) + cyclic.sum()),
+             (np.concatenate([edges.col, np.full(cyclic.sum(), N)]),
+              np.concatenate([edges.row, np.flatnonzero(cyclic)]))),
+            shape=(N + 1, N + 1))
+        Nloop = len(csgraph.breadth_first_order(reverse, N, return_predecessors=False)) - 1
+
+        return Eloop, Nloop
+
+
+def _condensation_reach_counts(labels: np.ndarray, row: np.ndarray, col: np.ndarray) -> np.ndarray:
+    '''
+    Counts the nodes reachable from each node of a directed graph, given the
+    strongly connected component label of each node and its edges ``row -> col``.
+
+    Every node of a component reaches the other nodes of its component and
+    everything reachable from the components it links to. The components
+    are visited in reverse topological order, and the set of nodes each
+    one reaches is built as a bitset (a Python int) from the bitsets of
+    its successors. Nodes are numbered component by component so that the
+    members of a component form a contiguous interval of bits. A bitset is
+    released as soon as all the components linking to it have used it.
+    '''
+    sizes = np.bincount(labels)
+    num_components = len(sizes)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    # Edges between distinct components, as successor and predecessor lists
+    external = labels[row] != labels[col]
+    pairs = np.unique(labels[row[external]].astype(np.int64) * num_components + labels[col[external]])
+    source, target = np.divmod(pairs, num_components)
+    successors = np.split(target, np.cumsum(np.bincount(source, minlength=num_components))[:-1])
+    order = np.argsort(target, kind='stable')
+    predecessors = np.split(source[order], np.cumsum(np.bincount(target, minlength=num_components))[:-1])
+
+    remaining_predecessors = np.bincount(target, minlength=num_components)
+    remaining_successors = np.bincount(source, minlength=num_components)
+    ready = deque(np.flatnonzero(remaining_successors == 0))
+
+    reach = {}
+    counts = np.zeros(num_components, dtype=np.int64)
+    while ready:
+        c = ready.popleft()
+        bits = 0
+        for s in successors[c]:
+            bits |= reach[s] | (((1 << int(sizes[s])) - 1) << int(starts[s]))
+            remaining_predecessors[s] -= 1
+            if remaining_predecessors[s] == 0:
+                del reach[s]
+        counts[c] = _popcount(bits)
+        if remaining_predecessors[c] > 0:
+            reach[c] = bits
+        for p in predecessors[c]:
+            remaining_successors[p] -= 1
+            if remaining_successors[p] == 0:
+                ready.append(p)
+
+    return (sizes - 1 + counts)[labels]
+
+
+def _popcount(bits: int) -> int:
+    '''
+    Number of set bits of a Python int.
+    '''
+    if hasattr(bits, 'bit_count'):
+        return bits.bit_count()
+    return bin(bits).count('1')
+
+
+def _labels(components, num_nodes: int) -> np.ndarray:
+    '''
+    Converts an iterable of sets of nodes into a label per node.
+    '''
+    labels = np.empty(num_nodes, dtype=np.int32)
+    for label, nodes in enumerate(components):
+        labels[list(nodes)] = label
+    return labels
+
+
+def _as_graph_analysis(A, directed: bool = False, backend: str = None) -> GraphAnalysis:
+    '''
+    Returns A if it is already a GraphAnalysis, otherwise prepares it.
+    '''
+    if isinstance(A, GraphAnalysis):
+        return A
+    return GraphAnalysis(A, directed, backend)
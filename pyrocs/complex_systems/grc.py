@@ -1,8 +1,15 @@
+import math
+
 import networkx as nx
 import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from pyrocs.complex_systems.graph_analysis import _as_graph_analysis
 
 
-def grc(A : np.ndarray, directed : bool) -> float:
+def grc(A : np.ndarray, directed : bool = False, backend : str = None,
+        weighted : bool = False) -> float:
     """
     Global reaching centrality (GRC) measures the level of hierarchy within a network based on flow. 
     The equation within the package follows the formulations from 
@@ -22,21 +29,293 @@ def grc(A : np.ndarray, directed : bool) -> float:
     0 to 1, with lower values indicating lower hierarchy and vice 
     versa :cite:p:`lakkaraju_complexity_2019`.
 
+    If ``weighted``, the entries of A are taken as edge weights, with the
+    semantics of ``nx.global_reaching_centrality(G, weight='weight')``:
+    a higher weight is a stronger connection, i.e. a shorter path, and each
+    node reached contributes the average weight of the edges along its
+    shortest path, relative to the average edge weight of the graph.
+    With the scipy backend, shortest paths are computed by Dijkstra
+    searches from blocks of sources, each restricted to the connected
+    component of its sources, and graphs whose edges all have the same
+    weight skip the searches altogether. Where several shortest paths
+    tie, the one networkx follows is taken (see :func:`_break_ties`).
+
     Args:
-        A (array): Adjacency matrix of graph structure
+        A (array): Adjacency matrix of graph structure, or a prepared
+            :class:`GraphAnalysis` (in which case ``directed`` is taken from it)
         directed (bool): If true, assume A represents a directed graph (row -> column).
             If false, assume A represents an undirected graph.
+        backend (optional str): graph backend, 'networkx' or 'scipy' (see :func:`set_backend`)
+        weighted (bool): If true, use the entries of A as (positive) edge weights
     Returns:
         float 
     """
 
-    if directed:
-        G = nx.from_numpy_array(A, nx.DiGraph)
-    else:
-        G = nx.from_numpy_array(A)
+    G = _as_graph_analysis(A, directed, backend)
         
-    if G.number_of_edges() == 0:
+    if G.number_of_edges == 0:
         print("WARNING: Social network to compute GRC over has no edges!")
         return 0.0
+    elif weighted and G.backend == 'networkx':
+        return nx.global_reaching_centrality(G.graph, weight='weight')
+    elif weighted:
+        return _global_reaching_centrality(_weighted_local_reaching_centrality(G))
+    elif G.directed or G.backend == 'scipy':
+        return _global_reaching_centrality(_local_reaching_centrality(G))
     else:
-        return nx.global_reaching_centrality(G)
+        return nx.global_reaching_centrality(G.graph)
+
+
+def grc_approximate(A : np.ndarray, directed : bool = False, num_samples : int = 1000,
+                    confidence : float = 0.95, seed : int = None,
+                    backend : str = None, weighted : bool = False) -> tuple:
+    """
+    Estimates the global reaching centrality (see :func:`grc`) of very
+    large graphs from the local reach centralities of a sample of nodes.
+
+    Since :math:`GRC = \\frac{N}{N-1}(C_R^\\max - \\bar{C_R})`, the average
+    :math:`\\bar{C_R}` is estimated from ``num_samples`` nodes drawn
+    uniformly at random, and :math:`C_R^\\max` is taken as the maximum over
+    those nodes and the ``num_samples`` nodes of highest (out-)degree.
+    As local reach centralities lie between 0 and 1, Hoeffding's inequality
+    bounds the error of the estimate by
+    :math:`\\frac{N}{N-1}\\sqrt{\\ln(2/(1-confidence))/(2\\,num\\_samples)}`
+    with probability ``confidence``, provided the maximum is attained
+    among the evaluated nodes (otherwise GRC is underestimated). When
+    ``num_samples`` covers the whole graph, the exact value is returned.
+
+    Args:
+        A (array): Adjacency matrix of graph structure, or a prepared
+            :class:`GraphAnalysis` (in which case ``directed`` is taken from it)
+        directed (bool): If true, assume A represents a directed graph (row -> column).
+            If false, assume A represents an undirected graph.
+        num_samples (int): number of nodes sampled
+        confidence (float): probability with which the error bound holds
+        seed (optional int): seed of the random number generator
+        backend (optional str): graph backend, 'networkx' or 'scipy' (see :func:`set_backend`)
+        weighted (bool): If true, use the entries of A as (positive) edge weights
+    Returns:
+        tuple(float) [estimate, error bound]
+    """
+    G = _as_graph_analysis(A, directed, backend)
+    N = G.number_of_nodes
+
+    if G.number_of_edges == 0 or num_samples >= N:
+        return grc(G, weighted=weighted), 0.0
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(N, num_samples, replace=False)
+    pattern = G.adjacency.astype(bool)
+    degree = np.diff((pattern if G.directed else pattern + pattern.T).indptr)
+    candidates = np.argsort(-degree, kind='stable')[:num_samples]
+
+    local_reaching_centrality = (_weighted_local_reaching_centrality if weighted
+                                 else _local_reaching_centrality)
+    lrc = local_reaching_centrality(G, sample)
+    max_lrc = max(lrc.max(), local_reaching_centrality(G, candidates).max())
+
+    estimate = N / (N - 1) * (max_lrc - lrc.mean())
+    error = N / (N - 1) * math.sqrt(math.log(2 / (1 - confidence)) / (2 * num_samples))
+    return float(estimate), error
+
+
+# Number of source nodes whose distances are held in memory at a time
+_BLOCK_SIZE = 256
+
+# Number of (search, edge) pairs examined at a time when resolving ties
+_MAX_ENTRIES = 2**22
+
+
+def _local_reaching_centrality(G, nodes : np.ndarray = None) -> np.ndarray:
+    '''
+    Computes the local reaching centrality of the given nodes (all nodes
+    by default), following ``nx.local_reaching_centrality``: the fraction
+    of nodes reachable from each node in a directed graph, and the average
+    over nodes of the inverse distance to them in an undirected graph.
+
+    In a directed graph, the reach counts of all nodes come from the
+    condensation of the graph (see ``GraphAnalysis.reach_counts``), while
+    those of a few nodes come from one breadth-first search each.
+    '''
+    N = G.number_of_nodes
+    if G.directed and nodes is None:
+        return G.reach_counts / (N - 1)
+
+    if nodes is None:
+        nodes = np.arange(N)
+    if G.directed:
+        return np.array([
+            len(csgraph.breadth_first_order(G.adjacency, node, return_predecessors=False)) - 1
+            for node in nodes]) / (N - 1)
+
+    sums = np.empty(len(nodes))
+    for start in range(0, len(nodes), _BLOCK_SIZE):
+        block = slice(start, start + _BLOCK_SIZE)
+        sources = nodes[block]
+        distances = csgraph.shortest_path(G.adjacency, directed=False,
+                                          unweighted=True, indices=sources)
+        with np.errstate(divide='ignore'):
+            terms = np.where(np.isfinite(distances), 1 / distances, 0)
+        terms[np.arange(len(sources)), sources] = 0
+
+        # Sum nearest nodes first, in the order networkx visits them
+        terms = np.sort(terms, axis=1)[:, ::-1]
+        sums[block] = np.cumsum(terms, axis=1)[:, -1]
+    return sums / (N - 1)
+
+
+def _weighted_local_reaching_centrality(G, nodes : np.ndarray = None) -> np.ndarray:
+    '''
+    Computes the local reaching centrality of the given nodes (all nodes
+    by default) in a weighted graph, following
+    ``nx.local_reaching_centrality`` with ``weight='weight'``: shortest
+    paths follow distances inversely proportional to the edge weights,
+    and each node reached adds the average weight of the edges along its
+    path, divided by the average edge weight of the graph.
+
+    When all edges have the same weight, every node reached adds 1, so
+    the reach counts are used directly. Otherwise the Dijkstra searches
+    run on the connected component of their sources only, so that the
+    work and memory of each search stop growing once the component is
+    exhausted.
+    '''
+    N = G.number_of_nodes
+    weights = G.edge_weights
+    if weights.data.min() < 0:
+        raise ValueError('edge weights must be positive')
+    total_weight = weights.sum()
+    norm = total_weight / G.number_of_edges
+    if nodes is None:
+        nodes = np.arange(N)
+
+    if weights.data.min() == weights.data.max():
+        return G.reach_counts[nodes] / (N - 1)
+
+    if not G.directed:
+        weights = (weights + sparse.triu(weights, 1).T).tocsr()
+    distances = weights.copy()
+    distances.data = total_weight / distances.data
+
+    # Nodes grouped by connected component, and their rank within it
+    labels = G.connected_components
+    sizes = np.bincount(labels)
+    by_label = np.argsort(labels, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.empty(N, dtype=np.int64)
+    rank[by_label] = np.arange(N) - starts[labels[by_label]]
+
+    sums = np.zeros(len(nodes))
+    positions = np.argsort(labels[nodes], kind='stable')
+    source_labels = labels[nodes][positions]
+    for c in np.unique(source_labels):
+        if sizes[c] == 1:
+            continue
+        members = by_label[starts[c]:starts[c] + sizes[c]]
+        component_weights = weights[members][:, members]
+        component_distances = distances[members][:, members]
+        component_positions = positions[source_labels == c]
+        for start in range(0, len(component_positions), _BLOCK_SIZE):
+            block = component_positions[start:start + _BLOCK_SIZE]
+            sources = rank[nodes[block]]
+            search_distances, predecessors = csgraph.dijkstra(
+                component_distances, directed=True, indices=sources, return_predecessors=True)
+            predecessors = _break_ties(component_distances, search_distances, predecessors)
+            sums[block] = _path_average_weights(component_weights, predecessors).sum(axis=1)
+    return sums / norm / (N - 1)
+
+
+def _break_ties(distances, search_distances : np.ndarray, predecessors : np.ndarray) -> np.ndarray:
+    '''
+    Replaces the predecessors found by ``csgraph.dijkstra`` (for each search
+    (row) and node (column)) where several shortest paths tie, so that the
+    paths followed are those of the Dijkstra search of networkx.
+
+    networkx settles nodes in order of distance, then of the order in which
+    they were queued, i.e. of the settling order of their predecessor and
+    of their position among its neighbors (by node index), and keeps the
+    predecessor settled first. In searches with ties, this order is found
+    by refining the ranks of the nodes, starting from their order by
+    distance and index, until the ranks stop changing; each round settles
+    at least one more distance level, so a few rounds usually suffice.
+    '''
+    edges = distances.tocoo()
+    if edges.nnz == 0:
+        return predecessors
+    order = np.lexsort((edges.row, edges.col))
+    tails, heads, lengths = edges.row[order], edges.col[order], edges.data[order]
+    starts = np.flatnonzero(np.concatenate([[True], heads[1:] != heads[:-1]]))
+    n = search_distances.shape[1]
+    nodes = np.arange(n)
+
+    step = max(_MAX_ENTRIES // len(heads), 1)
+    for start in range(0, len(search_distances), step):
+        block_distances = search_distances[start:start + step]
+        tail_distances = block_distances[:, tails]
+        tied = np.isfinite(tail_distances) & (tail_distances + lengths == block_distances[:, heads])
+        ambiguous = np.flatnonzero((np.add.reduceat(tied, starts, axis=1) > 1).any(axis=1))
+        if len(ambiguous) == 0:
+            continue
+        block_distances = block_distances[ambiguous]
+        tied = tied[ambiguous]
+
+        # Levels of equal distance, numbered in increasing order
+        by_distance = np.argsort(block_distances, axis=1, kind='stable')
+        sorted_distances = np.take_along_axis(block_distances, by_distance, axis=1)
+        levels = np.empty_like(by_distance)
+        changes = sorted_distances[:, 1:] != sorted_distances[:, :-1]
+        np.put_along_axis(levels, by_distance, np.concatenate(
+            [np.zeros((len(levels), 1), dtype=int), np.cumsum(changes, axis=1)], axis=1), axis=1)
+
+        parent_ranks = np.full(block_distances.shape, -1)
+        previous_ranks = None
+        while True:
+            settled = np.argsort(levels * (n + 1) + parent_ranks, axis=1, kind='stable')
+            ranks = np.empty_like(settled)
+            np.put_along_axis(ranks, settled, nodes[None, :], axis=1)
+            if previous_ranks is not None and np.array_equal(ranks, previous_ranks):
+                break
+            previous_ranks = ranks
+
+            first = np.minimum.reduceat(np.where(tied, np.take(ranks, tails, axis=1), n), starts, axis=1)
+            block_predecessors = np.full(block_distances.shape, -9999)
+            block_predecessors[:, heads[starts]] = np.where(
+                first < n, np.take_along_axis(settled, np.minimum(first, n - 1), axis=1), -9999)
+            parent_ranks = np.where(block_predecessors >= 0, np.take_along_axis(
+                ranks, np.maximum(block_predecessors, 0), axis=1), -1)
+        predecessors[start + ambiguous] = block_predecessors
+    return predecessors
+
+
+def _path_average_weights(weights, predecessors : np.ndarray) -> np.ndarray:
+    '''
+    Computes, for each search (row) and node (column), the average weight
+    of the edges along the path to the node recorded in ``predecessors``
+    (0 for the source and unreached nodes). The weight sums and edge counts
+    of all paths are accumulated by pointer jumping, in a number of steps
+    logarithmic in the longest path.
+    '''
+    num_searches, n = predecessors.shape
+    reached = predecessors >= 0
+    parents = np.where(reached, predecessors, np.arange(n))
+    weight_sums = np.zeros((num_searches, n))
+    weight_sums[reached] = np.asarray(
+        weights[parents[reached], np.nonzero(reached)[1]]).ravel()
+    hops = reached.astype(np.int64)
+
+    while True:
+        grandparents = np.take_along_axis(parents, parents, axis=1)
+        if np.array_equal(grandparents, parents):
+            break
+        weight_sums += np.take_along_axis(weight_sums, parents, axis=1)
+        hops += np.take_along_axis(hops, parents, axis=1)
+        parents = grandparents
+
+    return np.divide(weight_sums, hops, out=np.zeros_like(weight_sums), where=reached)
+
+
+def _global_reaching_centrality(lrc : np.ndarray) -> float:
+    '''
+    Computes the global reaching centrality from the local reaching
+    centralities, summing in node order like ``nx.global_reaching_centrality``.
+    '''
+    return float(np.cumsum(lrc.max() - lrc)[-1] / (len(lrc) - 1))
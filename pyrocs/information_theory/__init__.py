@@ -1,3 +1,5 @@
-from .kl_divergence import kl_divergence, novelty_transience_resonance
-from .entropy import discrete_entropy
-from .mutual_info import mutual_info
+from .contingency import ContingencyTable
+from .kl_divergence import kl_divergence, novelty_transience_resonance, NoveltyTransienceResonanceStream
+from .entropy import discrete_entropy, entropy_matrix
+from .mutual_info import mutual_info, mutual_info_matrix
+from .sketch import EntropySketch, MutualInfoSketch
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Number of buffered entries below which a table is not summed
+_MIN_PENDING = 2**20
+
+_MISSING = object()
+
+
+class ContingencyTable:
+    """
+    Sparse table of the joint counts of two discrete random variables,
+    with their marginal counts.
+
+    Only the observed (x, y) pairs are stored, as a ``scipy.sparse`` matrix
+    indexed by the distinct values of x and y, so memory is proportional to
+    the number of observed pairs even when both variables have very many
+    distinct values. Observations can be added in chunks with
+    :meth:`update`, and tables built from different chunks (e.g. in
+    separate processes) can be combined with :meth:`merge`.
+
+    The distinct values are numbered through dictionaries, and the counts
+    of each chunk are appended to buffers that are only summed into the
+    sparse matrix when it is read, or when they outgrow it, so adding K
+    chunks costs time linear in their size rather than in K times the size
+    of the table.
+
+    A table can be passed to :func:`discrete_entropy`, which returns the
+    joint entropy :math:`H(X,Y)`, and to :func:`mutual_info`, which can
+    also return the table it counts (see ``return_table``).
+
+    Args:
+        x (optional array): discretized observations from random distribution x
+        y (optional array): discretized observations from random distribution y
+        counts (array[int]): If present, the number of times each (x,y) pair was observed
+    """
+
+    def __init__(self, x=None, y=None, counts=None):
+        self._x_codes = {}
+        self._y_codes = {}
+        self._x_values = []
+        self._y_values = []
+        self._table = sparse.csr_matrix((0, 0))
+        self._pending = []
+        self._num_pending = 0
+        self._marginals = None
+        if x is not None:
+            self.update(x, y, counts)
+
+    def update(self, x, y, counts=None):
+        """
+        Adds observations of (x, y) pairs.
+
+        Args:
+            x (array): discretized observations from random distribution x
+            y (array): discretized observations from random distribution y
+            counts (array[int]): If present, the number of times each (x,y) pair was observed
+        Returns:
+            ContingencyTable
+        """
+        x_codes, x_values = _factorize(x)
+        y_codes, y_values = _factorize(y)
+        if len(x_codes) != len(y_codes):
+            raise ValueError('x and y must have the same length')
+        weights = np.ones(len(x_codes)) if counts is None else np.asarray(counts, dtype=float)
+
+        # Duplicate pairs are summed when converting to CSR
+        table = sparse.csr_matrix((weights, (x_codes, y_codes)),
+                                  shape=(len(x_values), len(y_values)))
+        return self._add(x_values, y_values, table)
+
+    def merge(self, other: 'ContingencyTable'):
+        """
+        Adds the counts of another table.
+
+        Args:
+            other (ContingencyTable): table of observations of the same variables
+        Returns:
+            ContingencyTable
+        """
+        return self._add(other._x_values, other._y_values, other.table)
+
+    def _add(self, x_values, y_values, table):
+        x_index = _encode(self._x_codes, self._x_values, x_values)
+        y_index = _encode(self._y_codes, self._y_values, y_values)
+        table = table.tocoo()
+        self._pending.append((x_index[table.row], y_index[table.col], table.data))
+        self._num_pending += table.nnz
+        self._marginals = None
+
+        # Sum the buffers once they outgrow the table, so that they take
+        # memory proportional to it and each entry is summed a few times
+        if self._num_pending > max(2 * self._table.nnz, _MIN_PENDING):
+            self._coalesce()
+        return self
+
+    def _coalesce(self):
+        shape = (len(self._x_values), len(self._y_values))
+        if not self._pending and self._table.shape == shape:
+            return
+        current = self._table.tocoo()
+        rows, cols, data = zip((current.row, current.col, current.data), *self._pending)
+        self._table = sparse.csr_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=shape)
+        self._pending = []
+        self._num_pending = 0
+
+    @property
+    def table(self) -> sparse.csr_matrix:
+        """Sparse matrix of the counts of each (x, y) pair, indexed by the codes of the values."""
+        self._coalesce()
+        return self._table
+
+    @property
+    def x_values(self) -> pd.Index:
+        """Distinct values of x, in order of first appearance."""
+        return pd.Index(self._x_values, tupleize_cols=False)
+
+    @property
+    def y_values(self) -> pd.Index:
+        """Distinct values of y, in order of first appearance."""
+        return pd.Index(self._y_values, tupleize_cols=False)
+
+    @property
+    def x_counts(self) -> np.ndarray:
+        """Counts of each value of x."""
+        return self._marginal_counts()[0]
+
+    @property
+    def y_counts(self) -> np.ndarray:
+        """Counts of each value of y."""
+        return self._marginal_counts()[1]
+
+    @property
+    def joint_counts(self) -> np.ndarray:
+        """Counts of the observed (x, y) pairs."""
+        return self.table.data
+
+    def _marginal_counts(self) -> tuple:
+        if self._marginals is None:
+            table = self.table
+            self._marginals = (np.asarray(table.sum(axis=1)).ravel(),
+                               np.asarray(table.sum(axis=0)).ravel())
+        return self._marginals
+
+
+def _factorize(values) -> tuple:
+    """
+    Encodes values as integer codes from 0 in order of first appearance,
+    returning the codes and the distinct values. Missing values count as
+    one value.
+    """
+    if isinstance(values, (list, tuple)):
+        values = pd.Series(values)
+    return pd.factorize(values, use_na_sentinel=False)
+
+
+def _encode(codes: dict, values: list, new_values) -> np.ndarray:
+    """
+    Returns the codes of new_values, numbering those not seen yet after
+    the known values (appended to ``values``). All missing values share
+    one code.
+    """
+    index = np.empty(len(new_values), dtype=np.int64)
+    for position, value in enumerate(new_values):
+        key = _MISSING if pd.isna(value) is True else value
+        code = codes.get(key)
+        if code is None:
+            code = codes[key] = len(values)
+            values.append(value)
+        index[position] = code
+    return index
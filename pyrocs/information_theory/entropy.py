@@ -1,7 +1,22 @@
 
 from collections import Counter
+from scipy.special import xlogy
 from scipy.stats import entropy
 import numpy as np
+import pandas as pd
+
+from pyrocs._chunks import iter_chunks, peek_all_chunks
+from pyrocs._parallel import parallel_map
+from pyrocs.information_theory.contingency import ContingencyTable
+
+# Columns with at most _MAX_ONE_HOT distinct values are counted by entropy_matrix
+# through one-hot indicators, in blocks of about _BLOCK_WIDTH indicators and
+# _MAX_ENTRIES indicator entries at a time
+_MAX_ONE_HOT = 256
+_BLOCK_WIDTH = 1024
+_MAX_ENTRIES = 2**22
+
+_PANDAS_TYPES = (pd.Series, pd.Index, pd.Categorical, pd.api.extensions.ExtensionArray)
 
 
 def discrete_entropy(
@@ -30,20 +45,256 @@ def discrete_entropy(
     For more details about entropy, please consult the 
     `scipy documentation <https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.entropy.html>`_ as well as the references noted above. 
 
+    NumPy arrays of numbers or strings and pandas inputs (including
+    categorical and Arrow-backed data) are counted with array operations;
+    other sequences of hashable values are counted one by one. Missing
+    values (NaNs) are counted as one value, including in sequences of
+    mixed objects, where every float NaN object (such as ``float('nan')``
+    or ``np.nan``) counts as that value while ``None`` and other objects
+    are compared by equality.
+
+    Given a :class:`ContingencyTable` of two variables, the joint entropy
+    of the pairs of values is returned.
+
+    Inputs too large for memory can be given as an ``np.memmap``, which is
+    read in blocks, or as an iterator of chunks of values (with counts, if
+    any, as an iterator of the matching chunks). The counts of the chunks
+    are merged as they are read, so memory grows with the number of
+    distinct values only.
+
     Args:
         values (array): Sequence of observed values from a random process
+            (or a ContingencyTable, or an iterator of chunks of values)
         counts (array[int]): Number of times each value was observed
         base (int): Base of returned entropy (default returns number of bits)
     Returns:
         float
     """
     
-    if counts is None:
-        counter = Counter(values)
-    else:
-        counter = Counter()
-        for item, count in zip(values, counts):
-            counter[item] += count
-    array = np.array(list(counter.values()), dtype=float)
+    if isinstance(values, ContingencyTable):
+        return _entropy_from_counts(values.joint_counts, base)
+
+    chunked, (values, counts) = peek_all_chunks(values=values, counts=counts)
+    if chunked or isinstance(values, np.memmap):
+        return _entropy_from_counts(_chunked_value_counts(values, counts), base)
+
+    array = _value_counts(values, counts)
+    if array is None:
+        if counts is None:
+            counter = Counter(values)
+        else:
+            counter = Counter()
+            for item, count in zip(values, counts):
+                counter[item] += count
+        # NaNs compare unequal, so each NaN object has its own key; count them as one value
+        nans = [item for item in counter if isinstance(item, float) and item != item]
+        nan_counts = [sum(counter.pop(item) for item in nans)] if nans else []
+        array = np.array(list(counter.values()) + nan_counts, dtype=float)
+    return _entropy_from_counts(array, base)
+
+
+def _entropy_from_counts(counts: np.ndarray, base: int = 2) -> float:
+    """
+    Computes the entropy of the distribution given by the counts of its
+    values.
+    """
+    array = np.array(counts, dtype=float)
     array /= array.sum()
     return entropy(array, base=base)
+
+
+def _value_counts(values, counts: np.ndarray = None) -> np.ndarray:
+    """
+    Counts the occurrences of each distinct value (weighted by counts, if
+    given) with array operations, or returns None when values are neither
+    a pandas object nor a 1-D numpy array of numbers or strings.
+
+    Small non-negative integers are counted with ``bincount``, other
+    arrays with ``np.unique``, and pandas objects with ``value_counts``.
+    Missing values (NaNs) are counted as one value, as by ``pd.factorize``.
+    """
+    if isinstance(values, _PANDAS_TYPES):
+        values = pd.Series(values)
+        if counts is None:
+            return values.value_counts(dropna=False, sort=False).to_numpy()
+        weights = pd.Series(np.asarray(counts), index=values.index)
+        return weights.groupby(values, dropna=False, observed=True, sort=False).sum().to_numpy()
+
+    if not isinstance(values, np.ndarray) or values.ndim != 1 or values.dtype.kind not in 'biufUS':
+        return None
+
+    if counts is not None:
+        counts = np.asarray(counts)
+        if len(counts) != len(values):
+            return None
+        counts = counts.astype(float)
+
+    if values.dtype.kind in 'biu' and len(values) and values.min() >= 0 and values.max() <= 2 * len(values):
+        binned = np.bincount(values.astype(np.int64), weights=counts)
+        return binned[np.bincount(values.astype(np.int64)) > 0]
+
+    if counts is None:
+        return np.unique(values, return_counts=True)[1]
+    _, inverse = np.unique(values, return_inverse=True)
+    return np.bincount(inverse.ravel(), weights=counts)
+
+
+def _chunked_value_counts(values, counts: np.ndarray = None) -> np.ndarray:
+    """
+    Counts the occurrences of each distinct value of an array read in
+    blocks or of an iterator of chunks, merging the counts of the chunks
+    by value. Missing values are counted as one value.
+    """
+    totals = pd.Series(dtype=float)
+    for chunk, chunk_counts in iter_chunks(values, counts):
+        keys = chunk if isinstance(chunk, np.ndarray) else pd.Series(chunk).to_numpy()
+        weights = np.ones(len(keys)) if chunk_counts is None else np.asarray(chunk_counts, dtype=float)
+        chunk_totals = pd.Series(weights).groupby(keys, dropna=False, sort=False).sum()
+        totals = totals.add(chunk_totals, fill_value=0)
+    return totals.to_numpy(dtype=float)
+
+
+def entropy_matrix(
+    data,
+    counts: np.ndarray = None,
+    base: int = 2,
+    n_jobs: int = None,
+    executor=None):
+    """
+    Computes the joint entropy :math:`H(X_i, X_j)` (see :func:`discrete_entropy`)
+    of every pair of columns of a table of discretized observations, whose
+    diagonal holds the entropy :math:`H(X_i)` of each column.
+
+    Each column is factorized into integer codes once. The joint histograms
+    of all pairs of columns with few distinct values are the blocks of
+    :math:`Z^T Z`, where :math:`Z` holds the one-hot indicators of the
+    values of every column, and are computed as matrix products over
+    blocks of columns. Pairs involving a column with many distinct values
+    are counted from combined codes instead. Missing values count as one
+    value. The blocks can be computed in parallel.
+
+    Args:
+        data (array): Table of observations, one column per variable (DataFrame or 2-D array)
+        counts (array[int]): If present, the number of times each row was observed
+        base (int): Base of returned entropy (default returns number of bits)
+        n_jobs (optional int): number of threads computing blocks in parallel
+            (-1 for all cores)
+        executor (optional Executor): ``concurrent.futures`` executor to
+            compute the blocks with (e.g. a process pool)
+    Returns:
+        array (DataFrame if data is a DataFrame)
+    """
+    codes, cardinalities = _factorize_columns(data)
+    weights = None if counts is None else np.asarray(counts, dtype=float)
+    num_rows, num_cols = codes.shape
+    total = num_rows if weights is None else weights.sum()
+
+    # Sums of c * log(c) over the joint histogram of each pair of columns
+    sums = np.zeros((num_cols, num_cols))
+
+    blocks = _column_blocks(np.flatnonzero(cardinalities <= _MAX_ONE_HOT), cardinalities)
+    pairs = [(I, J) for k, I in enumerate(blocks) for J in blocks[k:]]
+    tasks = ((codes, cardinalities, weights, I, J) for I, J in pairs)
+    for (I, J), block in zip(pairs, parallel_map(_one_hot_sums, tasks, n_jobs, executor)):
+        sums[np.ix_(I, J)] = block
+        sums[np.ix_(J, I)] = block.T
+
+    wide = np.flatnonzero(cardinalities > _MAX_ONE_HOT)
+    tasks = ((codes, cardinalities, weights, i) for i in wide)
+    for i, row in zip(wide, parallel_map(_keyed_sums, tasks, n_jobs, executor)):
+        sums[i] = row
+        sums[:, i] = row
+
+    result = (np.log(total) - sums / total) / np.log(base)
+    if isinstance(data, pd.DataFrame):
+        result = pd.DataFrame(result, index=data.columns, columns=data.columns)
+    return result
+
+
+def _factorize_columns(data) -> tuple:
+    """
+    Encodes the values of each column as integer codes from 0, returning
+    the codes (one column per variable) and the number of distinct values
+    of each column.
+    """
+    if isinstance(data, pd.DataFrame):
+        columns = [data.iloc[:, k] for k in range(data.shape[1])]
+    else:
+        columns = list(np.asarray(data).T)
+    codes = np.empty((len(data), len(columns)), dtype=np.int64)
+    cardinalities = np.empty(len(columns), dtype=np.int64)
+    for k, column in enumerate(columns):
+        column_codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        codes[:, k] = column_codes
+        cardinalities[k] = len(uniques)
+    return codes, cardinalities
+
+
+def _column_blocks(columns: np.ndarray, cardinalities: np.ndarray) -> list:
+    """
+    Splits columns into consecutive blocks of about _BLOCK_WIDTH one-hot
+    indicators.
+    """
+    blocks = []
+    start, width = 0, 0
+    for k, column in enumerate(columns):
+        if width and width + cardinalities[column] > _BLOCK_WIDTH:
+            blocks.append(columns[start:k])
+            start, width = k, 0
+        width += cardinalities[column]
+    if start < len(columns):
+        blocks.append(columns[start:])
+    return blocks
+
+
+def _one_hot(codes: np.ndarray, offsets: np.ndarray, dtype) -> np.ndarray:
+    """
+    Builds the one-hot indicators of the codes of several columns, the
+    indicators of column k starting at offsets[k].
+    """
+    indicators = np.zeros((len(codes), offsets[-1]), dtype=dtype)
+    indicators[np.arange(len(codes))[:, None], codes + offsets[:-1]] = 1
+    return indicators
+
+
+def _one_hot_sums(codes, cardinalities, weights, I, J) -> np.ndarray:
+    """
+    Computes the sums of c * log(c) over the joint histograms of the
+    columns I and J, from the products of their one-hot indicators,
+    accumulated over chunks of rows.
+    """
+    offsets_I = np.concatenate([[0], np.cumsum(cardinalities[I])])
+    offsets_J = np.concatenate([[0], np.cumsum(cardinalities[J])])
+    # Single precision products are exact for counts below 2**24
+    dtype = np.float32 if weights is None and len(codes) < 2**24 else np.float64
+
+    histograms = np.zeros((offsets_I[-1], offsets_J[-1]))
+    step = max(_MAX_ENTRIES // max(offsets_I[-1], offsets_J[-1]), 1)
+    for start in range(0, len(codes), step):
+        rows = slice(start, start + step)
+        left = _one_hot(codes[rows][:, I], offsets_I, dtype)
+        right = _one_hot(codes[rows][:, J], offsets_J, dtype)
+        if weights is not None:
+            right *= weights[rows, None]
+        histograms += left.T @ right
+
+    terms = xlogy(histograms, histograms)
+    return np.add.reduceat(np.add.reduceat(terms, offsets_I[:-1], axis=0), offsets_J[:-1], axis=1)
+
+
+def _keyed_sums(codes, cardinalities, weights, i) -> np.ndarray:
+    """
+    Computes the sums of c * log(c) over the joint histograms of column i
+    with every column, counting the combined codes of each pair.
+    """
+    first = codes[:, i]
+    sums = np.empty(codes.shape[1])
+    for j in range(codes.shape[1]):
+        keys = first * cardinalities[j] + codes[:, j]
+        if weights is None:
+            histogram = np.unique(keys, return_counts=True)[1]
+        else:
+            _, inverse = np.unique(keys, return_inverse=True)
+            histogram = np.bincount(inverse.ravel(), weights=weights)
+        sums[j] = xlogy(histogram, histogram).sum()
+    return sums
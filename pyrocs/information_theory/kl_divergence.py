@@ -1,6 +1,12 @@
+from collections.abc import Iterator
+
 import numpy as np
+from scipy.special import rel_entr, xlogy
+
+from pyrocs._chunks import iter_chunks, peek_all_chunks, row_blocks
 
-def kl_divergence(p: np.ndarray, q: np.ndarray, base: int = 2) -> float:
+def kl_divergence(p: np.ndarray, q: np.ndarray, base: int = 2, out: np.ndarray = None,
+                  where=True, pairwise: bool = False) -> float:
     """
     Sometimes called relative entropy, the Kullback-Leibler Divergence (KLD) 
     measures the similarity between two distributions 
@@ -20,37 +26,107 @@ def kl_divergence(p: np.ndarray, q: np.ndarray, base: int = 2) -> float:
     reference distribution respectively.
 
     The function is able to calculate KLD for cases where not all categories from the reference distribution are present within the sample distribution. 
+    Categories absent from the sample distribution contribute 0, and
+    categories present in the sample but absent from the reference make
+    the divergence infinite (see ``scipy.special.rel_entr``).
+
+    With ``pairwise``, p and q are two sets of distributions (one per row)
+    and the divergence of every row of p from every row of q is returned,
+    from the matrix product of p with the logarithm of q.
+
+    Distributions are processed in blocks of rows, so p and q can be
+    ``np.memmap`` arrays larger than memory (with ``out`` possibly a
+    memmap as well). Outside the pairwise mode, they can also be iterators
+    of matching blocks of rows, whose divergences are concatenated.
 
     Args:
         p (array): discrete probability distribution
         q (array): discrete probability distribution
         base (int): log base to compute from; base 2 (bits), base 10 (decimal/whole numbers), or base e (ecology, earth systems)
+        out (optional array): array in which to place the result
+        where (array[bool]): categories to include, broadcastable to p
+        pairwise (bool): If true, compute the divergences between all rows of p and q
 
     Returns:
-        float
+        float (array with one value per row for 2-D p and q, or per pair of rows if pairwise)
     """
+    if pairwise:
+        return _pairwise_kl_divergence(p, q, base, out, where)
+
+    chunked, (p, q) = peek_all_chunks(p=p, q=q)
+    if chunked:
+        kl_div = np.concatenate([np.atleast_1d(kl_divergence(p_chunk, q_chunk, base, where=where))
+                                 for p_chunk, q_chunk in iter_chunks(p, q)])
+        if out is None:
+            return kl_div
+        out[...] = kl_div
+        return out
 
     assert p.shape == q.shape, 'p and q shapes must be identical'
 
-    # Take ratio of p and q
-    ratio = p / q
-    
-    # Replace 0 values in ratio, to prevent nan result
-    ratio[ratio == 0] = 1
-    
-    logv = np.emath.logn(base, ratio)
+    where = np.broadcast_to(where, p.shape)
+    if p.ndim == 1:
+        kl_div = np.float64(sum(_relative_entropy(p[rows], q[rows], where[rows]).sum()
+                                for rows in row_blocks(p)))
+        if out is not None:
+            out[...] = kl_div
+            kl_div = out
+    else:
+        kl_div = np.empty(p.shape[:-1]) if out is None else out
+        for rows in row_blocks(p):
+            _relative_entropy(p[rows], q[rows], where[rows]).sum(axis=-1, out=kl_div[rows])
+    if base != np.e:
+        kl_div /= np.log(base)
+    return kl_div
 
-    if len(p.shape) == 1:
-        kl_div = (p * logv).sum()
-    elif len(p.shape) == 2:
-        kl_div = (p * logv).sum(axis=1)
 
-    return kl_div
+def _relative_entropy(p: np.ndarray, q: np.ndarray, where) -> np.ndarray:
+    '''
+    Computes the terms :math:`p \\log (p/q)` (in nats) of the categories
+    selected by where, and 0 elsewhere.
+    '''
+    return rel_entr(p, q, out=np.zeros(np.broadcast(p, q).shape), where=where)
+
+
+def _pairwise_kl_divergence(p: np.ndarray, q: np.ndarray, base: int = 2,
+                            out: np.ndarray = None, where=True) -> np.ndarray:
+    '''
+    Computes the divergence of every row of p from every row of q as
+    :math:`\\sum p \\log p - p (\\log q)^T`, over blocks of rows of p and
+    q. Logarithms of zero are replaced by 0 in the product, and pairs where
+    p has a category that q lacks are set to infinity afterwards.
+    '''
+    p = np.atleast_2d(p)
+    q = np.atleast_2d(q)
+    if p.shape[1] != q.shape[1]:
+        raise ValueError('p and q must have the same number of categories')
+    if where is not True:
+        where = np.broadcast_to(where, p.shape)
+    if out is None:
+        out = np.empty((p.shape[0], q.shape[0]))
+
+    for q_rows in row_blocks(q):
+        q_block = np.asarray(q[q_rows], dtype=float)
+        absent = q_block == 0
+        log_q = np.log(q_block, out=np.zeros(q_block.shape), where=~absent)
+        for p_rows in row_blocks(p):
+            p_block = np.asarray(p[p_rows], dtype=float)
+            if where is not True:
+                p_block = p_block * where[p_rows]
+            block = out[p_rows, q_rows]
+            np.matmul(p_block, log_q.T, out=block)
+            np.subtract(xlogy(p_block, p_block).sum(axis=1)[:, None], block, out=block)
+            if absent.any():
+                block[((p_block > 0).astype(float) @ absent.T.astype(float)) > 0] = np.inf
+    if base != np.e:
+        out /= np.log(base)
+    return out
 
 
 def novelty_transience_resonance(
     thetas_arr: np.ndarray, 
-    window: int) -> tuple[np.ndarray]:
+    window: int,
+    chunk_size: int = 1024) -> tuple[np.ndarray]:
     """
     These three related metrics extend the Kullback-Leibler Divergence formulation to consider how 
     a distribution differs from past and future distributions within a sequence. Specifically, novelty 
@@ -75,47 +151,169 @@ def novelty_transience_resonance(
     :math:`k` is the window of interest, and :math:`D` is the 
     equation for the KLD.
 
+    Since each divergence splits into a term of the distribution in the
+    window alone and a cross term linear in it, the average divergence
+    over a window only requires the sum of the distributions in the window
+    and the sum of their terms, obtained from cumulative sums. The series
+    is processed in chunks of ``chunk_size`` center rows to bound memory,
+    so thetas_arr can be an ``np.memmap`` larger than memory, or an
+    iterator of consecutive blocks of rows.
+
     Args:
-        thetas_arr (array): rows are topic mixtures
+        thetas_arr (array): rows are topic mixtures (or an iterator of blocks of rows)
         window (int): positive integer defining scale or scale size
+        chunk_size (int): number of center rows processed at a time
     Returns:
         tuple(array) [novelties, transiences, resonances] 
     """
+    if window < 1:
+        raise ValueError('window must be a positive integer')
 
-    # Find the first and last center speech offset, given window size.
-    window_start = window
-
-    # Calculate novelty, transience, resonance.
     novelties = []
     transiences = []
-    resonances = []
-    for j in range(window_start, thetas_arr.shape[0] - window, 1):
+    for block in _overlapping_blocks(thetas_arr, chunk_size, 2 * window):
+        block_novelties, block_transiences = _window_divergences(block, window)
+        novelties.append(block_novelties)
+        transiences.append(block_transiences)
+
+    novelties = np.concatenate(novelties) if novelties else np.empty(0)
+    transiences = np.concatenate(transiences) if transiences else np.empty(0)
+    return novelties, transiences, novelties - transiences
+
+
+def _overlapping_blocks(thetas_arr, chunk_size: int, overlap: int):
+    """
+    Yields the blocks of rows ``start:start + chunk_size + overlap`` of
+    thetas_arr for start = 0, chunk_size, ... (the last one possibly
+    shorter, but longer than ``overlap``) as float arrays. thetas_arr can
+    be an array, read one block at a time, or an iterator of blocks of
+    rows of any length, buffered until a block is complete.
+    """
+    size = chunk_size + overlap
+    if not isinstance(thetas_arr, Iterator):
+        for start in range(0, len(thetas_arr) - overlap, chunk_size):
+            yield np.asarray(thetas_arr[start:start + size], dtype=float)
+        return
+
+    buffered = None
+    for rows in thetas_arr:
+        rows = np.atleast_2d(np.asarray(rows, dtype=float))
+        buffered = rows if buffered is None else np.concatenate([buffered, rows])
+        while len(buffered) >= size:
+            yield buffered[:size]
+            buffered = buffered[chunk_size:]
+    if buffered is not None and len(buffered) > overlap:
+        yield buffered
+
+
+def _window_divergences(thetas_arr: np.ndarray, window: int) -> tuple:
+    """
+    Computes, for every row of thetas_arr at least ``window`` rows away
+    from both ends, the average divergence (in bits) of the ``window``
+    previous and next rows from it.
+
+    With :math:`p` a row of the window and :math:`q` the center row,
+    :math:`D(p||q) = \\sum p \\log p - \\sum p \\log q`, so the sum over the
+    window is the windowed sum of the first terms minus the windowed sum
+    of the rows against :math:`\\log q`. Terms with :math:`p = 0` vanish.
+    """
+    num_centers = thetas_arr.shape[0] - 2 * window
+    centers = thetas_arr[window:window + num_centers]
+
+    cumulative = np.zeros((thetas_arr.shape[0] + 1, thetas_arr.shape[1]))
+    np.cumsum(thetas_arr, axis=0, out=cumulative[1:])
+    cumulative_terms = np.concatenate([[0], np.cumsum(xlogy(thetas_arr, thetas_arr).sum(axis=1))])
+
+    def average_divergence(first):
+        # Divergences of the rows first, ..., first + window - 1 from the centers
+        last = first + window
+        rows = cumulative[last:last + num_centers] - cumulative[first:first + num_centers]
+        terms = cumulative_terms[last:last + num_centers] - cumulative_terms[first:first + num_centers]
+        return (terms - xlogy(rows, centers).sum(axis=1)) / (window * np.log(2))
+
+    return average_divergence(0), average_divergence(window + 1)
+
+
+class NoveltyTransienceResonanceStream:
+    """
+    Streaming version of :func:`novelty_transience_resonance`, for topic
+    mixtures that arrive one document (or a few) at a time.
+
+    Only the last ``max(windows) + 1`` mixtures are kept, in a ring buffer.
+    The novelty of a document is available as soon as it arrives, while its
+    transience and resonance are available once ``window`` further
+    documents have arrived. Each document costs a single cumulative sum
+    over the buffer, shared by all window sizes, i.e. :math:`O(window
+    \\times topics)`, and the history is never reprocessed.
+
+    Args:
+        windows (int or list[int]): positive integers defining the scales
+    """
+
+    def __init__(self, windows):
+        self.windows = np.atleast_1d(np.asarray(windows, dtype=int))
+        if np.any(self.windows < 1):
+            raise ValueError('windows must be positive integers')
+        self.num_documents = 0
+        self._size = int(self.windows.max()) + 1
+        self._thetas = None
+        self._terms = np.zeros(self._size)
+        self._novelties = np.full((self._size, len(self.windows)), np.nan)
 
-        center_theta = thetas_arr[j]
+    def update(self, thetas: np.ndarray) -> tuple:
+        """
+        Adds documents at the end of the feed.
 
-        # Define windows before and after center
-        after_boxend = j + window + 1
-        before_boxstart = j - window
+        For the k-th document added, with index t in the feed (counting
+        from 0), row k of the novelties holds its novelty for each window
+        size w, while rows k of the transiences and resonances hold those
+        of document t - w. Values are NaN for documents without a complete
+        window on either side, like those left out by
+        :func:`novelty_transience_resonance`.
 
-        before_theta_arr = thetas_arr[before_boxstart:j]
-        beforenum = before_theta_arr.shape[0]
-        before_centertheta_arr = np.tile(center_theta, reps=(beforenum, 1))
+        Args:
+            thetas (array): topic mixture of a document, or rows of topic mixtures
+        Returns:
+            tuple(array) [novelties, transiences, resonances], with one row
+            per document added and one column per window size
+        """
+        thetas = np.asarray(thetas, dtype=float)
+        if thetas.ndim == 1:
+            thetas = thetas[None, :]
+        if self._thetas is None:
+            self._thetas = np.zeros((self._size, thetas.shape[1]))
 
-        after_theta_arr = thetas_arr[j+1:after_boxend]
-        afternum = after_theta_arr.shape[0]
-        after_centertheta_arr = np.tile(center_theta, reps=(afternum, 1))
+        results = np.full((3, len(thetas), len(self.windows)), np.nan)
+        for k, theta in enumerate(thetas):
+            results[:, k] = self._add(theta)
+        return tuple(results)
 
-        # Calculate KLDs.
-        before_KLDs = kl_divergence(before_theta_arr, before_centertheta_arr)
-        after_KLDs = kl_divergence(after_theta_arr, after_centertheta_arr)
+    def _add(self, theta: np.ndarray) -> np.ndarray:
+        t = self.num_documents
+        position = t % self._size
+        self._thetas[position] = theta
+        self._terms[position] = xlogy(theta, theta).sum()
+        self.num_documents += 1
 
-        # Calculate means of KLD.
-        novelty = np.mean(before_KLDs)
-        transience = np.mean(after_KLDs)
+        # Rows and terms of documents t, t - 1, ... accumulated backwards
+        available = min(self.num_documents, self._size)
+        order = (position - np.arange(available)) % self._size
+        rows = np.cumsum(self._thetas[order], axis=0)
+        terms = np.cumsum(self._terms[order])
 
-        # Final measures for this center speech.
-        novelties.append(novelty)
-        transiences.append(transience)
-        resonances.append(novelty - transience)
+        results = np.full((3, len(self.windows)), np.nan)
+        for m, w in enumerate(self.windows):
+            if t >= w:
+                # Documents t - w, ..., t - 1 against document t
+                past_rows = rows[w] - theta
+                past_terms = terms[w] - terms[0]
+                results[0, m] = (past_terms - xlogy(past_rows, theta).sum()) / (w * np.log(2))
+            self._novelties[position, m] = results[0, m]
 
-    return novelties, transiences, resonances
+            if t >= 2 * w:
+                # Documents t - w + 1, ..., t against document t - w
+                center = order[w]
+                transience = (terms[w - 1] - xlogy(rows[w - 1], self._thetas[center]).sum()) / (w * np.log(2))
+                results[1, m] = transience
+                results[2, m] = self._novelties[center, m] - transience
+        return results
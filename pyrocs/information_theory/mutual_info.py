@@ -1,12 +1,16 @@
 import numpy as np
-from pyrocs.information_theory import discrete_entropy
+import pandas as pd
+from pyrocs._chunks import iter_chunks, peek_all_chunks
+from pyrocs.information_theory.contingency import ContingencyTable, _factorize
+from pyrocs.information_theory.entropy import discrete_entropy, entropy_matrix, _entropy_from_counts
 
 
 def mutual_info(
         x: np.ndarray,
-        y: np.ndarray,
+        y: np.ndarray = None,
         counts: np.ndarray = None,
-        base: int = 2) -> float:
+        base: int = 2,
+        return_table: bool = False) -> float:
     """
     Mutual information measures how much knowledge is gained about one random variable when another is observed.
     It is also a measure of mutual dependence between the random variables.
@@ -31,19 +35,110 @@ def mutual_info(
     indicate that more information can be gained about one variable 
     when the other is observed.
 
+    The observations of x and y are factorized into integer codes and
+    combined into a single joint code, so that the three entropies come
+    from one contingency table. Missing values count as one value.
+    Observations that cannot be factorized (e.g. unhashable by pandas)
+    are counted one by one. The mutual information can also be computed
+    from a :class:`ContingencyTable` of the observations, e.g. one merged
+    from chunks of data. Observations too large for memory can be given
+    as ``np.memmap`` arrays, which are read in blocks, or as iterators of
+    matching chunks of x, y (and counts), which are added to such a table
+    one chunk at a time.
+
     Args:
         x (array): discretized observations from random
-            distribution x \in X
+            distribution x \in X (or a ContingencyTable of x and y, or an
+            iterator of chunks of observations)
         y (array): discretized observations from random
             distribution y \in Y
         counts (array[int]): If present, the number of times each (x,y) pair was
             observed
         base (int): If present the base in which to return the entropy
+        return_table (bool): If true, also return the :class:`ContingencyTable`
+            of the observations
 
     Returns:
-        float
+        float (or tuple(float, ContingencyTable) if return_table)
     """
-    x_entropy = discrete_entropy(x, counts, base)
-    y_entropy = discrete_entropy(y, counts, base)
-    joint_entropy = discrete_entropy(zip(x, y), counts, base)
+    chunked, (x, y, counts) = peek_all_chunks(x=x, y=y, counts=counts)
+    if chunked or isinstance(x, np.memmap) or isinstance(y, np.memmap):
+        table = ContingencyTable()
+        for x_chunk, y_chunk, counts_chunk in iter_chunks(x, y, counts):
+            table.update(x_chunk, y_chunk, counts_chunk)
+        x = table
+
+    if return_table:
+        table = x if isinstance(x, ContingencyTable) else ContingencyTable(x, y, counts)
+        return mutual_info(table, base=base), table
+
+    if isinstance(x, ContingencyTable):
+        table = x.x_counts, x.y_counts, x.joint_counts
+    else:
+        table = _contingency_table(x, y, counts)
+    if table is None:
+        x_entropy = discrete_entropy(x, counts, base)
+        y_entropy = discrete_entropy(y, counts, base)
+        joint_entropy = discrete_entropy(zip(x, y), counts, base)
+        return x_entropy + y_entropy - joint_entropy
+
+    x_counts, y_counts, joint_counts = table
+    x_entropy = _entropy_from_counts(x_counts, base)
+    y_entropy = _entropy_from_counts(y_counts, base)
+    joint_entropy = _entropy_from_counts(joint_counts, base)
     return x_entropy + y_entropy - joint_entropy
+
+
+def _contingency_table(x, y, counts: np.ndarray = None) -> tuple:
+    """
+    Counts the observations of each value of x, of y and of each observed
+    (x, y) pair, from integer codes, or returns None when x and y cannot
+    be factorized.
+
+    Values and pairs are numbered in order of first appearance, so the
+    counts come in the same order as when counting observations one by
+    one, and give the same entropies.
+    """
+    try:
+        x_codes, x_values = _factorize(x)
+        y_codes, y_values = _factorize(y)
+    except TypeError:
+        return None
+    if len(x_codes) != len(y_codes) or (counts is not None and len(counts) != len(x_codes)):
+        return None
+
+    pairs, joint_codes = pd.factorize(x_codes.astype(np.int64) * len(y_values) + y_codes)
+    weights = None if counts is None else np.asarray(counts, dtype=float)
+    joint_counts = np.bincount(pairs, weights=weights)
+    x_counts = np.bincount(joint_codes // len(y_values), weights=joint_counts, minlength=len(x_values))
+    y_counts = np.bincount(joint_codes % len(y_values), weights=joint_counts, minlength=len(y_values))
+    return x_counts, y_counts, joint_counts
+
+
+def mutual_info_matrix(
+        data,
+        counts: np.ndarray = None,
+        base: int = 2,
+        n_jobs: int = None,
+        executor=None):
+    """
+    Computes the mutual information (see :func:`mutual_info`) of every pair
+    of columns of a table of discretized observations, from the joint
+    entropies of :func:`entropy_matrix`. The diagonal holds the entropy of
+    each column, its mutual information with itself.
+
+    Args:
+        data (array): Table of observations, one column per variable (DataFrame or 2-D array)
+        counts (array[int]): If present, the number of times each row was observed
+        base (int): If present the base in which to return the entropy
+        n_jobs (optional int): number of threads computing blocks in parallel
+            (-1 for all cores)
+        executor (optional Executor): ``concurrent.futures`` executor to
+            compute the blocks with (e.g. a process pool)
+
+    Returns:
+        array (DataFrame if data is a DataFrame)
+    """
+    joint_entropy = entropy_matrix(data, counts, base, n_jobs, executor)
+    entropies = np.diag(joint_entropy)
+    return entropies[:, None] + entropies[None, :] - joint_entropy
@@ -1,7 +1,9 @@
-from pyrocs.biosciences import affinity, functional_redundancy, hill_shannon, hill_simpson, hill_diversity
+from pyrocs.biosciences import affinity, affinity_blocks, affinity_top_k, AffinityAccumulator, functional_redundancy, trait_dissimilarity, hill_shannon, hill_simpson, hill_diversity, hill_diversity_profile, hill_bootstrap, hill_rarefaction
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pytest
 from pandas import DataFrame
+from scipy import sparse
 
 epsilon = 1e-7
 
@@ -41,6 +43,53 @@ def test_hill_diversity_edge_cases():
     q = 0
     assert hill_diversity(p, q) == 2
 
+def test_hill_diversity_profile():
+    p = np.array([[0.5, 0.3, 0.2, 0.0],
+                  [0.25, 0.25, 0.25, 0.25],
+                  [0.0, 0.0, 0.0, 0.0]])
+    q = np.array([0, 0.5, 1, 1 + 1e-12, 2, 3])
+    result = hill_diversity_profile(p, q)
+    assert result.shape == (3, 6)
+    assert np.array_equal(result, hill_diversity_profile(sparse.csr_matrix(p), q))
+
+    for i in range(2):
+        present = p[i][p[i] > 0]
+        expected = [hill_diversity(present, 0), hill_diversity(present, 0.5),
+                    hill_shannon(present), hill_shannon(present),
+                    hill_simpson(present), hill_diversity(present, 3)]
+        assert np.allclose(result[i], expected)
+    assert np.allclose(result[1], 4)
+    assert np.all(result[2] == 0)
+
+def test_hill_bootstrap():
+    counts = np.array([40, 20, 15, 8, 22, 1, 0])
+    q = [0, 1, 2]
+    estimate, lower, upper = hill_bootstrap(counts, q, num_resamples=200, seed=0, chunk_size=30)
+    assert np.allclose(estimate, [6, hill_shannon(counts[counts > 0] / 106), hill_simpson(counts / 106)])
+    assert np.all(lower <= upper)
+    assert np.all(upper <= 6)
+
+    # Results depend on the seed only, not on the number of workers
+    parallel = hill_bootstrap(counts, q, num_resamples=200, seed=0, chunk_size=30, n_jobs=3)
+    assert all(np.array_equal(a, b) for a, b in zip(parallel, (estimate, lower, upper)))
+
+def test_hill_rarefaction():
+    counts = np.array([40, 20, 15, 8, 22, 1, 0])
+    sizes, means, lower, upper = hill_rarefaction(counts, [0, 1], sizes=[1, 50, 106], seed=0)
+    assert np.array_equal(sizes, [1, 50, 106])
+    assert np.allclose(means[0], 1)
+    assert np.allclose(means[-1], [6, hill_shannon(counts[counts > 0] / 106)])
+    assert np.all(np.diff(means[:, 0]) >= 0)
+
+    # Both functions accept the same seed types
+    for function in [hill_bootstrap, hill_rarefaction]:
+        expected = function(counts, [0, 1], num_resamples=50, seed=3)
+        result = function(counts, [0, 1], num_resamples=50, seed=np.random.SeedSequence(3))
+        assert all(np.array_equal(a, b) for a, b in zip(result, expected))
+
+    with pytest.raises(ValueError):
+        hill_rarefaction(counts, 0, sizes=[107])
+
 ## TODO: add checking for negative p and q
 # def test_hill_diversity_invalid_input():
 #     p = np.array([-0.5, 0.3, 0.2])  # invalid input: probabilities should be non-negative
@@ -99,6 +148,132 @@ def test_affinity_all_one_input():
     assert result.shape == (2, 2)
     assert np.isnan(result[0][0])
 
+def test_affinity_matches_reference_values():
+    # Reference values computed with the original pairwise loop implementation
+    data = np.array([[0, 1, 1, 1, 0], [0, 0, 0, 0, 0], [0, 1, 0, 1, 0],
+                     [1, 0, 0, 1, 1], [1, 1, 0, 0, 0], [1, 0, 0, 0, 0],
+                     [0, 1, 1, 0, 0], [1, 1, 0, 0, 1], [0, 1, 0, 1, 1],
+                     [0, 1, 0, 1, 0], [0, 1, 0, 1, 1], [1, 1, 0, 1, 1]])
+    weights = np.array([2., 2., 3., 1., 3., 1., 2., 2., 3., 1., 3., 3.])
+
+    result = affinity(data)
+    assert np.array_equal(result, result.T, equal_nan=True)
+    assert np.isclose(result[0][1], -1.3862943611198906)
+    assert np.isclose(result[3][4], 1.6739764335716716)
+    assert np.isneginf(result[0][2])
+    assert np.isposinf(result[1][2])
+
+    result = affinity(data, weights)
+    assert np.isclose(result[0][1], -0.5596157879354228)
+    assert np.isclose(result[1][3], 1.8607523407150064)
+    assert np.isclose(result[3][4], 1.8971199848858813)
+
+    result = affinity(DataFrame(data), weights, to_bool=lambda x: x > 0.5)
+    assert np.isclose(result.loc[0, 4], 0.9162907318741551)
+
+def affinity_reference(data, weights):
+    # Original pairwise loop implementation of affinity
+    num_cols = data.shape[1]
+    counter = {}
+    for row, weight in zip(data, weights):
+        for i in range(num_cols):
+            for j in range(i, num_cols):
+                key = (i, j, bool(row[i]), bool(row[j]))
+                counter[key] = counter.get(key, 0) + weight
+    result = np.zeros((num_cols, num_cols))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(num_cols):
+            for j in range(i, num_cols):
+                neither, both, i_without_j, j_without_i = (
+                    np.float64(counter.get((i, j, i_val, j_val), 0))
+                    for i_val, j_val in [(False, False), (True, True), (True, False), (False, True)])
+                result[i][j] = result[j][i] = np.log((both / j_without_i) / (i_without_j / neither))
+    return result
+
+def test_affinity_zero_weights():
+    # Cells backed only by sites of weight 0 must be exactly empty
+    rng = np.random.default_rng(4)
+    for _ in range(20):
+        data = (rng.random((12, 6)) < 0.4).astype(int)
+        weights = rng.choice([0, 0.1, 0.2, 0.3, 0.7], 12)
+        expected = affinity_reference(data, weights)
+        assert np.allclose(affinity(data, weights), expected, equal_nan=True)
+        accumulator = AffinityAccumulator().update(data[:5], weights[:5]).update(data[5:], weights[5:])
+        assert np.allclose(accumulator.result(), expected, equal_nan=True)
+
+def test_affinity_sparse_and_blocks():
+    rng = np.random.default_rng(0)
+    data = (rng.random((50, 12)) < 0.2).astype(int)
+    weights = rng.integers(1, 4, 50)
+    expected = affinity(data, weights)
+
+    result = affinity(sparse.csr_matrix(data), weights, block_size=5)
+    assert np.array_equal(result, expected, equal_nan=True)
+
+    out = np.zeros((12, 12))
+    result = affinity(data, weights, block_size=5, out=out)
+    assert result is out
+    assert np.array_equal(out, expected, equal_nan=True)
+
+    blocks = list(affinity_blocks(sparse.csc_matrix(data), 5, weights))
+    assert [len(cols) for cols, _ in blocks] == [5, 5, 2]
+    assert np.array_equal(np.hstack([block for _, block in blocks]), expected, equal_nan=True)
+
+    with pytest.raises(ValueError):
+        affinity(sparse.csr_matrix(data), to_bool=lambda x: x < 1)
+
+def test_affinity_top_k():
+    rng = np.random.default_rng(1)
+    data = (rng.random((80, 10)) < 0.4).astype(int)
+    expected = affinity(data)
+
+    indices, values = affinity_top_k(sparse.csr_matrix(data), 3, block_size=4)
+    assert indices.shape == values.shape == (10, 3)
+    for j in range(10):
+        assert j not in indices[j]
+        assert np.array_equal(values[j], expected[j, indices[j]], equal_nan=True)
+        others = np.delete(np.nan_to_num(expected[j], nan=-np.inf), j)
+        assert np.array_equal(np.nan_to_num(values[j], nan=-np.inf), np.sort(others)[::-1][:3])
+
+def test_affinity_parallel():
+    rng = np.random.default_rng(3)
+    data = rng.random((60, 30)) < 0.3
+    weights = rng.random(60)
+    expected = affinity(data, weights, block_size=4)
+
+    result = affinity(data, weights, block_size=4, n_jobs=3)
+    assert np.array_equal(result, expected, equal_nan=True)
+
+    indices, values = affinity_top_k(data, 2, weights, block_size=4, n_jobs=2)
+    assert np.array_equal(indices, affinity_top_k(data, 2, weights, block_size=4)[0])
+
+    # Process pools read the data from shared memory, dense or sparse
+    with ProcessPoolExecutor(2) as executor:
+        result = affinity(data, weights, block_size=4, executor=executor)
+        assert np.array_equal(result, expected, equal_nan=True)
+        result = affinity(sparse.csr_matrix(data), weights, block_size=4, executor=executor)
+        assert np.allclose(result, expected, equal_nan=True)
+
+def test_affinity_accumulator():
+    rng = np.random.default_rng(2)
+    data = (rng.random((90, 8)) < 0.3).astype(int)
+    weights = rng.integers(1, 4, 90)
+    expected = affinity(data, weights)
+
+    first = AffinityAccumulator()
+    first.update(data[:30], weights[:30])
+    first.update(sparse.csr_matrix(data[30:50]), weights[30:50])
+    second = AffinityAccumulator().update(data[50:], weights[50:])
+    result = first.merge(second).result()
+    assert np.array_equal(result, expected, equal_nan=True)
+
+    result = AffinityAccumulator().update(DataFrame(data)).result()
+    assert isinstance(result, DataFrame)
+    assert np.array_equal(result.to_numpy(), affinity(data), equal_nan=True)
+
+    with pytest.raises(ValueError):
+        AffinityAccumulator().result()
+
 def test_affinity_invalid_input():
     # Test with invalid input data
     with pytest.raises(AttributeError):
@@ -135,6 +310,34 @@ def test_functional_rednundancy():
     
     assert(functional_redundancy(data[:, -1], delta))
 
+def test_functional_redundancy_batch():
+    rng = np.random.default_rng(5)
+    delta = rng.random((9, 9))
+    delta = (delta + delta.T) / 2
+    np.fill_diagonal(delta, 0)
+    data = rng.random((6, 9)) * (rng.random((6, 9)) < 0.6)
+    data[:, 0] += 0.1
+    data = data / data.sum(axis=1)[:, None]
+
+    # One value per assemblage, for dense, sparse and operator inputs
+    expected = np.array([functional_redundancy(p, delta) for p in data])
+    assert np.allclose(functional_redundancy(data, delta), expected)
+    assert np.allclose(functional_redundancy(sparse.csr_matrix(data), sparse.csr_matrix(delta)), expected)
+    operator = sparse.linalg.aslinearoperator(delta)
+    assert np.allclose(functional_redundancy(data, operator), expected)
+    assert np.allclose(functional_redundancy(sparse.csr_matrix(data), operator), expected)
+
+def test_functional_redundancy_trait_dissimilarity():
+    rng = np.random.default_rng(4)
+    traits = rng.random((40, 3))
+    delta = np.linalg.norm(traits[:, None] - traits[None, :], axis=-1)
+    p = rng.random((5, 40))
+    p = p / p.sum(axis=1)[:, None]
+
+    operator = trait_dissimilarity(traits, block_size=16)
+    assert np.allclose(functional_redundancy(p, operator), functional_redundancy(p, delta))
+    assert np.isclose(functional_redundancy(p[0], operator), functional_redundancy(p[0], delta))
+
 def test_hill_shannon():
     species_freq = np.array([40, 20, 15, 8, 22])
     species_p = species_freq/species_freq.sum()
@@ -163,6 +366,8 @@ def test_hill_diversity():
 if __name__ == '__main__': 
     test_hill_simpson()
     test_functional_rednundancy()
+    test_functional_redundancy_batch()
+    test_functional_redundancy_trait_dissimilarity()
     test_hill_shannon()
     test_hill_simpson()
     test_hill_diversity()
@@ -173,8 +378,16 @@ if __name__ == '__main__':
     test_affinity_to_bool()
     test_affinity_no_weights()
     test_affinity_all_one_input()
+    test_affinity_sparse_and_blocks()
+    test_affinity_top_k()
+    test_affinity_parallel()
+    test_affinity_accumulator()
+    test_affinity_zero_weights()
     # test_hill_diversity_invalid_input()
     test_hill_diversity_edge_cases()
+    test_hill_diversity_profile()
+    test_hill_bootstrap()
+    test_hill_rarefaction()
     test_hill_diversity()
     test_hill_simpson()
     test_hill_shannon()
\ No newline at end of file
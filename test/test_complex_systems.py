@@ -1,8 +1,63 @@
 from pyrocs.complex_systems import cyclomatic_complexity, feedback_density, causal_complexity, grc, fluctuation_complexity
+from pyrocs.complex_systems import GraphAnalysis, set_backend, get_backend, grc_approximate
+from pyrocs.complex_systems import grc_batch, causal_complexity_batch, FluctuationComplexityAccumulator
+from pyrocs.complex_systems import fluctuation_complexity_multiscale
+from scipy import sparse
 import numpy as np
 import pytest
 import networkx
 import networkx as nx
+import math
+from collections import Counter
+
+########### REFERENCE IMPLEMENTATIONS ###########
+def feedback_density_reference(A, directed=False):
+    # Original per-edge / per-node search implementation of feedback_density
+    if directed:
+        G = nx.from_numpy_array(A, parallel_edges=False, create_using=nx.MultiDiGraph)
+    else:
+        G = nx.from_numpy_array(A, parallel_edges=False)
+
+    Etot = nx.number_of_edges(G)
+    Ntot = nx.number_of_nodes(G)
+
+    Eloop = 0
+    for edge in G.edges:
+        try:
+            if nx.has_path(G, edge[1], edge[0]):
+                Eloop = Eloop + 1
+        except nx.NetworkXNoPath:
+            pass
+
+    Nloop = 0
+    for node in G.nodes:
+        try:
+            if nx.find_cycle(G, node) != None:
+                Nloop = Nloop + 1
+        except nx.NetworkXNoCycle:
+            pass
+
+    return (Eloop + Nloop) / (Etot + Ntot)
+
+def fluctuation_complexity_reference(A, L=1):
+    # Original tuple / Counter implementation of fluctuation_complexity
+    if L > 1:
+        A = [tuple(A[i: i + L]) for i in range(len(A) + 1 - L)]
+    freqs = Counter(A)
+    total_sqr_diff = 0
+    for a, b in zip(A[:-1], A[1:]):
+        log_freq_ratio = math.log2(freqs[a] / freqs[b])
+        total_sqr_diff += log_freq_ratio * log_freq_ratio
+    return total_sqr_diff / (len(A) - 1)
+
+def random_adjacency(rng, n, density, symmetric=False, self_loops=True):
+    A = (rng.random((n, n)) < density).astype(int)
+    if symmetric:
+        A = np.triu(A)
+        A = A + np.triu(A, 1).T
+    if not self_loops:
+        np.fill_diagonal(A, 0)
+    return A
 
 ########### MAIN FUNCTIONS ###########
 def test_cyclomatic_complexity():
@@ -23,6 +78,16 @@ def test_feedback_density():
     A = np.array([[0, 1, 0], [0, 0, 1], [1, 0, 0]])
     assert feedback_density(A, directed=True) > 0.5
 
+def test_feedback_density_matches_reference():
+    rng = np.random.default_rng(0)
+    for n in [1, 2, 5, 12, 30]:
+        for density in [0.02, 0.08, 0.2]:
+            for self_loops in [True, False]:
+                A = random_adjacency(rng, n, density, self_loops=self_loops)
+                assert feedback_density(A, directed=True) == feedback_density_reference(A, directed=True)
+                A = random_adjacency(rng, n, density, symmetric=True, self_loops=self_loops)
+                assert feedback_density(A) == feedback_density_reference(A)
+
 def test_causal_complexity():
     # Test undirected graph
     A = np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]])
@@ -53,6 +118,58 @@ def test_fluctuation_complexity_L_eq_1():
     result = fluctuation_complexity(A, L)
     assert isinstance(result, float)
 
+def test_fluctuation_complexity_matches_reference():
+    rng = np.random.default_rng(6)
+    for n, L, k in [(2, 1, 2), (50, 1, 5), (1000, 3, 4), (1000, 12, 3), (300, 40, 100)]:
+        A = rng.integers(0, k, n)
+        expected = fluctuation_complexity_reference(list(A), L)
+        assert fluctuation_complexity(A, L) == expected
+        assert fluctuation_complexity(list(A * 0.5), L) == expected
+
+    A = np.array(list('abracadabra'))
+    assert fluctuation_complexity(A, 2) == fluctuation_complexity_reference(list(A), 2)
+    # Sequences of arbitrary hashable symbols
+    A = ['a', (1, 2), 3, 'a', 3, 'a']
+    assert fluctuation_complexity(A) == fluctuation_complexity_reference(A)
+
+def test_fluctuation_complexity_multiscale():
+    rng = np.random.default_rng(8)
+    Ls = [1, 2, 3, 5, 8, 13, 32]
+    for n, k in [(40, 2), (1000, 3), (500, 50)]:
+        A = rng.integers(0, k, n)
+        expected = [fluctuation_complexity(A, L) for L in Ls]
+        assert list(fluctuation_complexity_multiscale(A, Ls)) == expected
+
+    # Lengths leaving fewer than two words
+    result = fluctuation_complexity_multiscale(['a', 'b', 'a', 'c'], [1, 2, 4])
+    assert result[:2].tolist() == [fluctuation_complexity(['a', 'b', 'a', 'c'], L) for L in [1, 2]]
+    assert np.isnan(result[2])
+
+def test_fluctuation_complexity_accumulator():
+    rng = np.random.default_rng(7)
+    A = list(rng.integers(0, 4, 1000))
+    for L in [1, 3]:
+        accumulator = FluctuationComplexityAccumulator(L)
+        for start in range(0, len(A), 97):
+            accumulator.update(A[start:start + 97])
+        assert np.isclose(accumulator.value(), fluctuation_complexity(A, L))
+
+        # A sliding window covers the last words only
+        windowed = FluctuationComplexityAccumulator(L, window=200)
+        for start in range(0, len(A), 31):
+            windowed.update(A[start:start + 31])
+        assert np.isclose(windowed.value(), fluctuation_complexity(A[-(200 + L - 1):], L))
+
+        # Without decay, all words weigh the same
+        decayed = FluctuationComplexityAccumulator(L, decay=1).update(A)
+        assert np.isclose(decayed.value(), fluctuation_complexity(A, L))
+
+    # Old words are forgotten under strong decay
+    decayed = FluctuationComplexityAccumulator(decay=0.5).update(['a', 'b'] * 500 + ['a'] * 1000)
+    assert decayed.value() == 0
+    with pytest.raises(ValueError):
+        FluctuationComplexityAccumulator(window=10, decay=0.9)
+
 def test_grc_undirected():
     # Test undirected graph with edges
     A = np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]])
@@ -65,12 +182,149 @@ def test_grc_directed():
     result = grc(A, directed=True)
     assert result > 0
 
+def test_grc_directed_path():
+    # Only the source of a directed path reaches every other node
+    A = np.array([[0, 1, 0], [0, 0, 1], [0, 0, 0]])
+    assert grc(A, directed=True) == 0.75
+
+def test_grc_matches_networkx():
+    rng = np.random.default_rng(3)
+    for n, density in [(5, 0.3), (20, 0.1), (60, 0.03)]:
+        A = random_adjacency(rng, n, density)
+        G = nx.from_numpy_array(A, create_using=nx.DiGraph)
+        assert grc(A, directed=True) == nx.global_reaching_centrality(G)
+        assert grc(A, directed=True, backend='scipy') == nx.global_reaching_centrality(G)
+
+def test_grc_approximate():
+    rng = np.random.default_rng(4)
+    for directed in [False, True]:
+        A = random_adjacency(rng, 200, 0.01, symmetric=not directed)
+        exact = grc(A, directed=directed)
+        estimate, error = grc_approximate(A, directed=directed, num_samples=50, seed=0)
+        assert error > 0
+        assert abs(estimate - exact) <= error
+        assert grc_approximate(A, directed=directed, num_samples=200) == (exact, 0.0)
+
 def test_grc_no_edges():
     # Test graph with no edges
     A = np.array([[0, 0, 0], [0, 0, 0], [0, 0, 0]])
     result = grc(A, directed=False)
     assert result == 0.0
 
+def test_grc_weighted():
+    rng = np.random.default_rng(5)
+    for n, density in [(2, 0.5), (15, 0.15), (40, 0.05)]:
+        for directed in [False, True]:
+            A = random_adjacency(rng, n, density, symmetric=not directed) * rng.random((n, n))
+            if not A.any():
+                continue
+            expected = nx.global_reaching_centrality(
+                nx.from_numpy_array(A, create_using=nx.DiGraph if directed else nx.Graph), weight='weight')
+            assert grc(A, directed, weighted=True) == expected
+            assert np.isclose(grc(A, directed, backend='scipy', weighted=True), expected)
+
+            # Equal weights skip the shortest path searches
+            B = (A > 0) * 2.0
+            assert np.isclose(grc(B, directed, backend='scipy', weighted=True),
+                              grc(B, directed, weighted=True))
+
+    A = random_adjacency(rng, 10, 0.2)
+    with pytest.raises(ValueError):
+        grc(-A, True, backend='scipy', weighted=True)
+
+def test_grc_weighted_ties():
+    # 0 -> 3 directly and through 1 are equally short, and networkx keeps
+    # the direct edge, reached first
+    A = np.zeros((4, 4))
+    A[0, 1] = A[1, 3] = 2
+    A[0, 3] = 1
+    A[2, 0] = 1
+    assert np.isclose(grc(A, True, backend='scipy', weighted=True), grc(A, True, weighted=True))
+
+    # From 5, 4 is as far through 3 as through 2, both at the same distance;
+    # networkx keeps 3, queued before 2
+    A = np.array([[0, 0, 2, 0, 0, 0, 1], [1, 0, 0, 2, 0, 0, 1], [0, 0, 0, 0, 2, 0, 3],
+                  [2, 0, 0, 0, 2, 0, 0], [0, 0, 2, 0, 0, 3, 0], [2, 0, 0, 1, 0, 0, 0],
+                  [0, 0, 0, 2, 0, 0, 0]], dtype=float)
+    assert np.isclose(grc(A, True, backend='scipy', weighted=True), grc(A, True, weighted=True))
+
+    rng = np.random.default_rng(6)
+    for trial in range(100):
+        directed = bool(trial % 2)
+        A = random_adjacency(rng, 8, 0.35, symmetric=not directed) * rng.integers(1, 4, (8, 8))
+        if A.any():
+            assert np.isclose(grc(A, directed, backend='scipy', weighted=True),
+                              grc(A, directed, weighted=True))
+
+def test_graph_analysis():
+    rng = np.random.default_rng(1)
+    for directed in [False, True]:
+        A = random_adjacency(rng, 25, 0.08, symmetric=not directed)
+        G = GraphAnalysis(A, directed=directed)
+        assert cyclomatic_complexity(G) == cyclomatic_complexity(A, directed=directed)
+        assert feedback_density(G) == feedback_density_reference(A, directed=directed)
+        assert causal_complexity(G) == causal_complexity(A, directed=directed)
+        assert grc(G) == grc(A, directed=directed)
+
+        # Sparse and edge list inputs describe the same graph
+        assert causal_complexity(GraphAnalysis(sparse.csr_matrix(A), directed)) == causal_complexity(G)
+        edges = np.argwhere(A)
+        assert causal_complexity(GraphAnalysis.from_edge_list(edges, 25, directed)) == causal_complexity(G)
+
+def test_scipy_backend():
+    rng = np.random.default_rng(2)
+    for n, density in [(2, 0.5), (15, 0.1), (40, 0.05)]:
+        for directed in [False, True]:
+            A = random_adjacency(rng, n, density, symmetric=not directed) * rng.integers(1, 4, (n, n))
+            for metric in [cyclomatic_complexity, feedback_density, causal_complexity, grc]:
+                assert metric(A, directed, backend='scipy') == metric(A, directed, backend='networkx')
+
+    A = random_adjacency(rng, 20, 0.1)
+    expected = causal_complexity(A, directed=True)
+    assert get_backend() == 'networkx'
+    set_backend('scipy')
+    try:
+        assert GraphAnalysis(A).backend == 'scipy'
+        assert causal_complexity(A, directed=True) == expected
+    finally:
+        set_backend('networkx')
+
+    with pytest.raises(ValueError):
+        set_backend('igraph')
+
+def test_graph_analysis_update():
+    rng = np.random.default_rng(3)
+    for directed in [False, True]:
+        A = random_adjacency(rng, 30, 0.06, symmetric=not directed)
+        G = GraphAnalysis(A, directed)
+        for _ in range(20):
+            i, j = rng.integers(0, 30, 2)
+            A = A.copy()
+            A[i, j] = 1 - A[i, j]
+            if not directed:
+                A[j, i] = A[i, j]
+            causal_complexity(G), grc(G)
+            G = G.update(A)
+            assert causal_complexity(G) == causal_complexity(A, directed)
+            assert grc(G) == grc(A, directed)
+
+    # Unchanged edges reuse every decomposition
+    A = random_adjacency(rng, 20, 0.1)
+    G = GraphAnalysis(A, True)
+    G.reach_counts
+    assert G.update(A * 2).reach_counts is G.reach_counts
+
+def test_batch():
+    rng = np.random.default_rng(4)
+    for directed in [False, True]:
+        snapshots = [random_adjacency(rng, 20, 0.08, symmetric=not directed) for _ in range(10)]
+        expected_grc = [grc(A, directed) for A in snapshots]
+        expected_cc = [causal_complexity(A, directed) for A in snapshots]
+        assert list(grc_batch(np.stack(snapshots), directed)) == expected_grc
+        assert list(causal_complexity_batch(iter(snapshots), directed, run_length=3, n_jobs=2)) == expected_cc
+        matrices = (sparse.csr_matrix(A) for A in snapshots)
+        assert list(causal_complexity_batch(matrices, directed, backend='scipy')) == expected_cc
+
 def test_grc_non_numpy_input():
     # Test non-Numpy array input
     A = [[0, 1, 0], [1, 0, 1], [0, 1, 0]]
@@ -80,12 +334,25 @@ def test_grc_non_numpy_input():
 if __name__ == '__main__':
     test_cyclomatic_complexity()
     test_feedback_density()
+    test_feedback_density_matches_reference()
     test_causal_complexity()
     test_fluctuation_complexity_default_L()
     test_fluctuation_complexity_L_gt_1()
     test_fluctuation_complexity_single_element_sequence()
     test_fluctuation_complexity_L_eq_1()
+    test_fluctuation_complexity_matches_reference()
+    test_fluctuation_complexity_multiscale()
+    test_fluctuation_complexity_accumulator()
     test_grc_undirected()
     test_grc_directed()
+    test_grc_directed_path()
+    test_grc_matches_networkx()
+    test_grc_approximate()
+    test_grc_weighted()
+    test_grc_weighted_ties()
     test_grc_no_edges()
+    test_graph_analysis()
+    test_scipy_backend()
+    test_graph_analysis_update()
+    test_batch()
     test_grc_non_numpy_input()
@@ -1,7 +1,28 @@
 from pyrocs.information_theory import kl_divergence, novelty_transience_resonance, discrete_entropy, mutual_info
+from pyrocs.information_theory import entropy_matrix, mutual_info_matrix, ContingencyTable
+from pyrocs.information_theory import NoveltyTransienceResonanceStream, EntropySketch, MutualInfoSketch
 from scipy.stats import entropy
 import numpy as np
+import pandas as pd
 import pytest
+import os
+import tempfile
+from collections import Counter
+import pyrocs._chunks
+
+
+def entropy_reference(values, counts=None, base=2):
+    # Original Counter implementation of discrete_entropy
+    if counts is None:
+        counter = Counter(values)
+    else:
+        counter = Counter()
+        for item, count in zip(values, counts):
+            counter[item] += count
+    array = np.array(list(counter.values()), dtype=float)
+    array /= array.sum()
+    return entropy(array, base=base)
+
 
 def test_kl_divergence():
     # Test with identical distributions
@@ -28,6 +49,37 @@ def test_kl_divergence_base():
     assert np.isclose(kl_divergence(p, q, base=np.e), 0.18378689738681217, atol=1e-5)
 
 
+def test_kl_divergence_pairwise():
+    rng = np.random.default_rng(0)
+    p = rng.dirichlet(np.ones(5), size=4)
+    q = rng.dirichlet(np.ones(5), size=3)
+    p[0, 1] = 0
+    p[0] /= p[0].sum()
+    q[2, 3] = 0
+    q[2] /= q[2].sum()
+
+    expected = np.array([[kl_divergence(pi, qj) for qj in q] for pi in p])
+    assert np.isinf(expected[1:, 2]).all()
+    assert np.allclose(kl_divergence(p, q, pairwise=True), expected)
+    assert np.allclose(kl_divergence(p, q, base=np.e, pairwise=True), expected * np.log(2))
+
+    out = np.empty((4, 3))
+    assert kl_divergence(p, q, pairwise=True, out=out) is out
+    assert np.allclose(out, expected)
+
+    # Zeros in p contribute nothing, and q=0 where p>0 gives infinity
+    assert np.isclose(kl_divergence(np.array([0.5, 0.5, 0]), np.array([0.25, 0.25, 0.5])), 1)
+    assert np.isinf(kl_divergence(np.array([0.5, 0.5]), np.array([1.0, 0])))
+
+    # Masked categories are left out of the sum
+    where = np.array([True, True, False, True, True])
+    assert np.allclose(kl_divergence(p, p[::-1], where=where),
+                       [kl_divergence(pi[where], qi[where]) for pi, qi in zip(p, p[::-1])])
+    rows = np.empty(4)
+    assert kl_divergence(p, p, out=rows) is rows
+    assert np.allclose(rows, 0)
+
+
 def test_novelty_transience_resonance():
     # Test with simple example
     thetas_arr = np.array([[0.5, 0.5], [0.7, 0.3], [0.4, 0.6], [0.8, 0.2]])
@@ -38,6 +90,45 @@ def test_novelty_transience_resonance():
     assert np.allclose(resonances, [-0.15128864767897612, -0.21785905441544606], atol=1e-5)
 
 
+def test_novelty_transience_resonance_windows():
+    rng = np.random.default_rng(4)
+    thetas = rng.dirichlet(np.ones(20), 300)
+    window = 10
+    novelties, transiences, resonances = novelty_transience_resonance(thetas, window, chunk_size=37)
+    assert len(novelties) == 300 - 2 * window
+    for i, j in enumerate(range(window, 300 - window)):
+        before = [kl_divergence(thetas[j - k], thetas[j]) for k in range(1, window + 1)]
+        after = [kl_divergence(thetas[j + k], thetas[j]) for k in range(1, window + 1)]
+        assert np.isclose(novelties[i], np.mean(before))
+        assert np.isclose(transiences[i], np.mean(after))
+    assert np.allclose(resonances, novelties - transiences)
+
+    # Series too short for a single window
+    assert len(novelty_transience_resonance(thetas[:20], window)[0]) == 0
+
+
+def test_novelty_transience_resonance_stream():
+    rng = np.random.default_rng(5)
+    thetas = rng.dirichlet(np.ones(8), 200)
+    windows = [1, 3, 10]
+    stream = NoveltyTransienceResonanceStream(windows)
+    updates = [stream.update(thetas[start:start + 7]) for start in range(0, 200, 7)]
+    novelties, transiences, resonances = (np.vstack([u[k] for u in updates]) for k in range(3))
+    assert novelties.shape == (200, 3)
+
+    for m, w in enumerate(windows):
+        expected = novelty_transience_resonance(thetas, w)
+        assert np.all(np.isnan(novelties[:w, m]))
+        assert np.allclose(novelties[w:200 - w, m], expected[0])
+        # Transience and resonance of document t - w arrive with document t
+        assert np.all(np.isnan(transiences[:2 * w, m]))
+        assert np.allclose(transiences[2 * w:, m], expected[1])
+        assert np.allclose(resonances[2 * w:, m], expected[2])
+
+    # A single document
+    assert stream.update(thetas[0])[0].shape == (1, 3)
+
+
 def test_discrete_entropy_values_only():
     values = [1, 2, 2, 3, 3, 3]
     result = discrete_entropy(values)
@@ -81,16 +172,213 @@ def test_discrete_entropy_all_elements_same_input():
     assert np.isclose(result, 0)
 
 
+def test_discrete_entropy_arrays():
+    rng = np.random.default_rng(0)
+    for values in [rng.integers(0, 5, 100), rng.integers(-3, 10**9, 100),
+                   rng.random(50).round(1), np.array(list('abcaab'))]:
+        weights = rng.integers(1, 5, len(values))
+        assert np.isclose(discrete_entropy(values), discrete_entropy(list(values)))
+        assert np.isclose(discrete_entropy(values, weights), discrete_entropy(list(values), list(weights)))
+        assert np.isclose(discrete_entropy(pd.Series(values)), discrete_entropy(list(values)))
+
+    # NaNs are one value, as in mutual_info
+    values = np.array([1.0, np.nan, np.nan, 2.0, np.nan, 1.0])
+    assert np.isclose(discrete_entropy(values), entropy([2, 3, 1], base=2))
+    for data in [values, [1.0, float('nan'), float('nan'), 2.0, np.nan, 1.0], pd.Series(values),
+                 iter(np.array_split(values, 3))]:
+        assert np.isclose(discrete_entropy(data), entropy([2, 3, 1], base=2))
+    assert np.isclose(mutual_info(values, values), discrete_entropy(values))
+    assert np.isclose(discrete_entropy(values, [1, 2, 1, 1, 1, 1]), entropy([2, 4, 1], base=2))
+
+    # Sequences of mixed objects are counted one by one, with every float
+    # NaN object as the same value and None as a value of its own
+    mixed = ['a', float('nan'), 1, np.float64('nan'), 'a', np.nan, None, float('nan')]
+    assert np.isclose(discrete_entropy(mixed), entropy([2, 4, 1, 1], base=2))
+    assert np.isclose(discrete_entropy(mixed, [1, 1, 2, 1, 1, 3, 1, 1]), entropy([2, 6, 2, 1], base=2))
+
+    # Categorical data, with missing and unobserved categories
+    values = pd.Series(['a', 'b', None, 'a'], dtype=pd.CategoricalDtype(['a', 'b', 'c']))
+    assert np.isclose(discrete_entropy(values), 1.5)
+    assert np.isclose(discrete_entropy(values, [1, 2, 1, 4]), entropy([5, 2, 1], base=2))
+
+
 def test_mutual_info():
     x = [1, 2, 3, 4, 5]
     y = [1, 2, 3, 4, 5]
 
     assert(mutual_info(x, y) == 2.3219280948873626)
 
+def test_mutual_info_matches_reference():
+    rng = np.random.default_rng(2)
+    for n, k in [(5, 5), (100, 3), (1000, 30)]:
+        x = rng.integers(0, k, n)
+        y = (x + rng.integers(0, 3, n)) % k
+        counts = rng.integers(1, 5, n)
+        for a, b in [(x, y), (list(x), list(y)), (x.astype(str), y * 0.5)]:
+            for weights in [None, counts]:
+                expected = (entropy_reference(a, weights) + entropy_reference(b, weights)
+                            - entropy_reference(list(zip(a, b)), weights))
+                assert mutual_info(a, b, weights) == expected
+
+    # Mixed hashable values
+    assert np.isclose(mutual_info([1, 'a', (1, 2)], [1, 1, 2]), 0.9182958340544896)
+
+
+def test_contingency_table():
+    rng = np.random.default_rng(3)
+    x = rng.integers(0, 50, 3000)
+    y = (x + rng.integers(0, 5, 3000)) % 60
+    counts = rng.integers(1, 4, 3000)
+    expected = mutual_info(x, y, counts)
+
+    table = ContingencyTable(x, y, counts)
+    assert table.table.nnz == len(set(zip(x, y)))
+    assert np.isclose(mutual_info(table), expected)
+    assert np.isclose(discrete_entropy(table), discrete_entropy(list(zip(x, y)), counts))
+
+    # Tables of chunks, with values in a different order, merged together
+    merged = ContingencyTable()
+    for start in range(0, 3000, 700):
+        chunk = slice(start, start + 700)
+        merged.merge(ContingencyTable(list(x[chunk]), y[chunk], counts[chunk]))
+    assert np.isclose(mutual_info(merged), expected)
+    assert np.array_equal(merged.x_counts[np.argsort(merged.x_values)], np.bincount(x, weights=counts))
+
+    # Many small chunks are buffered and summed once
+    streamed = ContingencyTable()
+    for start in range(0, 3000, 10):
+        streamed.update(x[start:start + 10], y[start:start + 10], counts[start:start + 10])
+    assert streamed.table.nnz == table.table.nnz
+    assert np.isclose(mutual_info(streamed), expected)
+    assert streamed.x_values.equals(table.x_values)
+
+    value, produced = mutual_info(x, y, counts, return_table=True)
+    assert np.isclose(value, expected)
+    assert isinstance(produced, ContingencyTable)
+    assert np.array_equal(produced.y_counts, table.y_counts)
+    value, produced = mutual_info(iter(np.array_split(x, 3)), iter(np.array_split(y, 3)), return_table=True)
+    assert np.isclose(value, mutual_info(x, y))
+    assert produced.table.sum() == len(x)
+
+
+def test_mutual_info_matrix():
+    rng = np.random.default_rng(1)
+    # Includes a column with many distinct values and a constant column
+    X = np.column_stack([rng.integers(0, k, 400) for k in [2, 3, 7, 50, 400, 1]])
+    data = pd.DataFrame(X, columns=list('abcdef'))
+    counts = rng.integers(1, 4, 400)
+
+    for weights in [None, counts]:
+        result = mutual_info_matrix(data, weights)
+        assert list(result.columns) == list('abcdef')
+        for i in range(6):
+            for j in range(6):
+                expected = mutual_info(list(X[:, i]), list(X[:, j]), None if weights is None else list(weights))
+                assert np.isclose(result.iloc[i, j], expected)
+
+        joint = entropy_matrix(X, weights, base=10)
+        assert np.allclose(joint, joint.T)
+        assert np.isclose(joint[2, 2], discrete_entropy(X[:, 2], weights, base=10))
+
+    assert np.allclose(mutual_info_matrix(X, counts, n_jobs=2), mutual_info_matrix(X, counts))
+
+
+def test_chunked_inputs():
+    rng = np.random.default_rng(0)
+    x = rng.integers(0, 20, 5000)
+    y = (x + rng.integers(0, 3, len(x))) % 7
+    weights = rng.integers(1, 4, len(x))
+    thetas = rng.dirichlet(np.ones(4), size=300)
+    q = rng.dirichlet(np.ones(4), size=300)
+    chunks = lambda a: iter(np.array_split(a, 7))
+
+    block_entries = pyrocs._chunks._BLOCK_ENTRIES
+    pyrocs._chunks._BLOCK_ENTRIES = 256
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            def memmap(a, name):
+                m = np.lib.format.open_memmap(os.path.join(directory, name + '.npy'),
+                                              mode='w+', dtype=a.dtype, shape=a.shape)
+                m[:] = a
+                return m
+
+            x_map, y_map, thetas_map = memmap(x, 'x'), memmap(y, 'y'), memmap(thetas, 'thetas')
+
+            assert np.isclose(discrete_entropy(x_map), discrete_entropy(x))
+            assert np.isclose(discrete_entropy(chunks(x), chunks(weights)), discrete_entropy(x, weights))
+            assert np.isclose(discrete_entropy(iter([[0.5, np.nan], [np.nan, 0.5]])),
+                              discrete_entropy([0.5, np.nan, np.nan, 0.5]))
+
+            assert np.isclose(mutual_info(x_map, y_map), mutual_info(x, y))
+            assert np.isclose(mutual_info(chunks(x), chunks(y), chunks(weights)), mutual_info(x, y, weights))
+
+            # Arguments chunked differently are rejected upfront
+            for args in [(chunks(x), chunks(y), weights), (x, y, chunks(weights)), (chunks(x), y)]:
+                with pytest.raises(ValueError, match='chunked the same way'):
+                    mutual_info(*args)
+            with pytest.raises(ValueError, match='chunked the same way'):
+                discrete_entropy(chunks(x), weights)
+            with pytest.raises(ValueError, match='chunked the same way'):
+                kl_divergence(chunks(thetas), q)
+
+            assert np.allclose(kl_divergence(thetas_map, q), kl_divergence(thetas, q))
+            assert np.allclose(kl_divergence(chunks(thetas), chunks(q)), kl_divergence(thetas, q))
+            assert np.allclose(kl_divergence(thetas_map, q[:50], pairwise=True),
+                               kl_divergence(thetas, q[:50], pairwise=True))
+
+            expected = novelty_transience_resonance(thetas, 3, chunk_size=40)
+            for result in [novelty_transience_resonance(thetas_map, 3, chunk_size=40),
+                           novelty_transience_resonance(chunks(thetas), 3, chunk_size=40)]:
+                for values, expected_values in zip(result, expected):
+                    assert np.array_equal(values, expected_values)
+            del x_map, y_map, thetas_map
+    finally:
+        pyrocs._chunks._BLOCK_ENTRIES = block_entries
+
+
+def test_entropy_sketch():
+    rng = np.random.default_rng(0)
+    values = rng.zipf(1.5, 20000)
+    sketch = EntropySketch(seed=1).update(values)
+    error = np.sqrt(3 / sketch.num_projections) / np.log(2)
+    assert abs(sketch.estimate() - discrete_entropy(values)) < 4 * error
+    assert np.isclose(sketch.estimate(base=np.e), sketch.estimate() * np.log(2))
+
+    # Shards combine into the sketch of all observations, whatever the dtype
+    shards = [EntropySketch(seed=1).update(chunk) for chunk in np.array_split(values, 3)]
+    shards[2] = EntropySketch(seed=1).update(np.array_split(values, 3)[2].astype(float))
+    merged = shards[0].merge(shards[1]).merge(shards[2])
+    assert np.allclose(merged.projections, sketch.projections)
+    assert merged.total == len(values)
+
+    counted = EntropySketch().update(['a', 'b', ('c', 1)], counts=[2, 1, 1])
+    assert np.allclose(counted.projections, EntropySketch().update(['a', 'b', 'a', ('c', 1)]).projections)
+    assert EntropySketch().update(['a', 'a']).estimate() < 4 * error
+    assert np.isnan(EntropySketch().estimate())
+    with pytest.raises(ValueError):
+        sketch.merge(EntropySketch(seed=2))
+
+
+def test_mutual_info_sketch():
+    rng = np.random.default_rng(0)
+    x = rng.integers(0, 200, 20000)
+    y = (x + rng.integers(0, 3, len(x))) % 40
+    sketch = MutualInfoSketch().update(x, y)
+    error = 3 * np.sqrt(3 / 1024) / np.log(2)
+    assert abs(sketch.estimate() - mutual_info(x, y)) < 4 * error
+
+    halves = [MutualInfoSketch().update(xs, ys) for xs, ys in zip(np.array_split(x, 2), np.array_split(y, 2))]
+    merged = halves[0].merge(halves[1])
+    assert np.isclose(merged.estimate(), sketch.estimate())
+
+
 if __name__ == '__main__':
     test_kl_divergence()
     test_kl_divergence_base()
+    test_kl_divergence_pairwise()
     test_novelty_transience_resonance()
+    test_novelty_transience_resonance_windows()
+    test_novelty_transience_resonance_stream()
     test_discrete_entropy_values_only()
     test_discrete_entropy_values_and_counts()
     test_discrete_entropy_default_base()
@@ -98,5 +386,11 @@ if __name__ == '__main__':
     test_discrete_entropy_single_element_input()
     test_discrete_entropy_all_elements_unique_input()
     test_discrete_entropy_all_elements_same_input()
+    test_discrete_entropy_arrays()
     test_mutual_info()
-
+    test_mutual_info_matches_reference()
+    test_contingency_table()
+    test_mutual_info_matrix()
+    test_chunked_inputs()
+    test_entropy_sketch()
+    test_mutual_info_sketch()